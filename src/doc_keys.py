@@ -0,0 +1,65 @@
+from array import array
+from mmap import ACCESS_READ, mmap
+from os import path
+from typing import Iterable, List
+
+# the binary document keys of an index are stored on two files. The data file
+# has the fields of the document keys of each document, separated by tabs and
+# encoded in UTF-8, one document after the other in the order of their
+# surrogate keys, which start at 1. The offsets file has the end offset of
+# each document on the data file, as 64 bit integers in the native byte
+# order. Both files are only appended to, so the documents of an incremental
+# index are added without rewriting the previous ones
+DOC_KEYS_DATA_FILE_NAME = 'DocKeys.bin'
+DOC_KEYS_OFFSETS_FILE_NAME = 'DocKeyOffsets.bin'
+
+
+def write_doc_keys(index_folder_path: str, doc_keys_rows: Iterable[List[str]],
+                   append: bool = False) -> None:
+    file_mode = 'ab' if append else 'wb'
+    with open(path.join(index_folder_path, DOC_KEYS_DATA_FILE_NAME),
+              file_mode) as data_file, \
+            open(path.join(index_folder_path, DOC_KEYS_OFFSETS_FILE_NAME),
+                 file_mode) as offsets_file:
+        offset = data_file.tell()
+        end_offsets = array('Q')
+        for doc_keys_row in doc_keys_rows:
+            record = '\t'.join(doc_keys_row).encode('utf8')
+            data_file.write(record)
+            offset += len(record)
+            end_offsets.append(offset)
+        offsets_file.write(end_offsets.tobytes())
+
+
+def map_file(file_path: str) -> memoryview:
+    with open(file_path, 'rb') as file:
+        # empty files can't be memory mapped
+        if path.getsize(file_path) == 0:
+            return memoryview(b'')
+        return memoryview(mmap(file.fileno(), 0, access=ACCESS_READ))
+
+
+# memory mapped document keys, which are indexed by surrogate key like the
+# dictionary of document keys, and only decoded when they are accessed
+class DocKeyStore:
+    data: memoryview
+    end_offsets: memoryview
+
+    def __init__(self, index_folder_path: str) -> None:
+        self.data = map_file(path.join(index_folder_path,
+                                       DOC_KEYS_DATA_FILE_NAME))
+        self.end_offsets = map_file(path.join(
+            index_folder_path, DOC_KEYS_OFFSETS_FILE_NAME)).cast('Q')
+
+    def __len__(self) -> int:
+        return len(self.end_offsets)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return 1 <= doc_id <= len(self.end_offsets)
+
+    def __getitem__(self, doc_id: int) -> List[str]:
+        if doc_id not in self:
+            raise KeyError(doc_id)
+        start = self.end_offsets[doc_id - 2] if doc_id > 1 else 0
+        end = self.end_offsets[doc_id - 1]
+        return str(self.data[start:end], 'utf8').split('\t')
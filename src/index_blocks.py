@@ -0,0 +1,64 @@
+from typing import BinaryIO, Dict, Iterator, Tuple
+
+from postings import decode_varint, encode_varint
+
+# file extension of the index blocks for each index format
+BLOCK_FILE_EXTENSIONS: Dict[str, str] = {
+    'tsv': '.tsv',
+    'binary': '.bin',
+}
+
+
+# each record of a binary index block has the length of the term followed by
+# the term encoded in UTF-8, and the length of the encoded posting list
+# followed by the posting list itself, so that the posting lists of other
+# terms can be skipped without being decoded. The length of the header is
+# returned to find where the posting list starts
+def write_binary_record(block_file: BinaryIO, term: str,
+                        posting_list_bytes: bytes) -> int:
+    term_bytes = term.encode('utf8')
+    header = encode_varint(len(term_bytes)) + term_bytes \
+        + encode_varint(len(posting_list_bytes))
+    block_file.write(header + posting_list_bytes)
+
+    # the posting list starts after the header of the record
+    return len(header)
+
+
+def read_file_varint(block_file: BinaryIO) -> int:
+    value = 0
+    shift = 0
+    while True:
+        byte = block_file.read(1)
+        if byte == b'':
+            raise EOFError
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+# stream the records of a binary index block from a file, returning the term
+# and its encoded posting list
+def read_binary_records(block_file: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    while True:
+        try:
+            term_length = read_file_varint(block_file)
+        except EOFError:
+            return
+        term = block_file.read(term_length).decode('utf8')
+        posting_list_length = read_file_varint(block_file)
+        yield term, block_file.read(posting_list_length)
+
+
+# iterate over the records of a binary index block already in memory,
+# returning the term and the start and end offsets of its encoded posting list
+def iterate_binary_records(data: bytes) -> Iterator[Tuple[str, int, int]]:
+    offset = 0
+    while offset < len(data):
+        term_length, offset = decode_varint(data, offset)
+        term = bytes(data[offset:offset + term_length]).decode('utf8')
+        posting_list_length, offset = decode_varint(data,
+                                                    offset + term_length)
+        yield term, offset, offset + posting_list_length
+        offset += posting_list_length
@@ -1,27 +1,169 @@
 import gzip
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import (Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
 from configparser import ConfigParser
 from contextlib import ExitStack
 from csv import QUOTE_NONE, field_size_limit, reader, unix_dialect, writer
 from glob import glob
-from os import makedirs, path
+from heapq import merge
+from io import (DEFAULT_BUFFER_SIZE, BufferedReader, RawIOBase, StringIO,
+                TextIOWrapper)
+from itertools import chain, groupby
+from operator import itemgetter
+from os import makedirs, path, replace, sysconf
+from queue import Empty, Full, Queue
+from shutil import rmtree
+from threading import Event, Thread
 from time import time
-from typing import DefaultDict, Dict, List, Tuple
+from typing import (Any, BinaryIO, DefaultDict, Dict, Iterable, Iterator, List,
+                    Optional, TextIO, Tuple, Union)
 
-from postings import Posting, PostingPositional
+from doc_keys import (DOC_KEYS_DATA_FILE_NAME, DOC_KEYS_OFFSETS_FILE_NAME,
+                      write_doc_keys)
+from lexicon import LEXICON_FILE_NAME, write_lexicon
+from index_blocks import (BLOCK_FILE_EXTENSIONS, read_binary_records,
+                          write_binary_record)
+from postings import Posting, PostingList, PostingPositional
+from segments import (Segment, read_obsolete_segments, read_segments,
+                      select_segments_to_merge, write_obsolete_segments,
+                      write_segments)
 from tokenizer import Tokenizer
 
+# estimated bytes of memory used by each term of an index block, besides its
+# posting list, for the dictionary entry and the term string
+TERM_MEMORY_ESTIMATE = 100
+
+# bytes used by each position of a posting
+POSITION_MEMORY_SIZE = 4
+
+# fraction of the memory limit used by the final index block during the
+# merge, the rest is used to read ahead the temporary index blocks
+MERGE_BLOCK_MEMORY_FRACTION = 0.7
+
+# bytes of the decompressed data source handed over at once by the reader
+# thread, and maximum number of chunks waiting to be parsed
+READER_CHUNK_SIZE = 1048576
+READER_QUEUE_SIZE = 8
+
+
+# resident set size of this process, in MB
+def get_resident_memory() -> float:
+    try:
+        with open('/proc/self/statm') as statm_file:
+            return int(statm_file.read().split()[1]) \
+                * sysconf('SC_PAGE_SIZE') / 1000000.0
+    except OSError:
+        from resource import RUSAGE_SELF, getrusage
+        return getrusage(RUSAGE_SELF).ru_maxrss / 1000.0
+
+
+# the decompressed data of a data source is read ahead by a producer thread,
+# which hands it over in chunks through a bounded queue. The decompression
+# releases the GIL, so it overlaps with the parsing and indexing of the
+# previous chunks. Closing the reader stops the thread, which must happen
+# before the data source file is closed
+class BackgroundReader(RawIOBase):
+    chunk_queue: Queue
+    stop_event: Event
+    reader_thread: Thread
+    chunk: memoryview
+    chunk_offset: int
+
+    def __init__(self, source_file: BinaryIO,
+                 chunk_size: int = READER_CHUNK_SIZE,
+                 queue_size: int = READER_QUEUE_SIZE) -> None:
+        super().__init__()
+        self.chunk_queue = Queue(maxsize=queue_size)
+        self.stop_event = Event()
+        self.chunk = memoryview(b'')
+        self.chunk_offset = 0
+        self.reader_thread = Thread(target=self.produce_chunks,
+                                    args=(source_file, chunk_size),
+                                    daemon=True)
+        self.reader_thread.start()
+
+    # the end of the data source is signalled by an empty chunk, and an error
+    # by the exception itself, which is raised again on the consumer
+    def produce_chunks(self, source_file: BinaryIO, chunk_size: int) -> None:
+        try:
+            while True:
+                chunk = source_file.read(chunk_size)
+                self.put_chunk(chunk)
+                if len(chunk) == 0:
+                    return
+        except BaseException as error:
+            self.put_chunk(error)
+
+    # the producer gives up waiting for room on the queue once the consumer
+    # has stopped
+    def put_chunk(self, chunk: Union[bytes, BaseException]) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.chunk_queue.put(chunk, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if self.chunk_offset >= len(self.chunk):
+            chunk = self.chunk_queue.get()
+            if isinstance(chunk, BaseException) or len(chunk) == 0:
+                # keep the end of the data source, or its error, for later
+                # reads
+                self.chunk_queue.put(chunk)
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                return 0
+            self.chunk = memoryview(chunk)
+            self.chunk_offset = 0
+
+        size = min(len(buffer), len(self.chunk) - self.chunk_offset)
+        buffer[:size] = self.chunk[self.chunk_offset:self.chunk_offset + size]
+        self.chunk_offset += size
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stop_event.set()
+            try:
+                while True:
+                    self.chunk_queue.get_nowait()
+            except Empty:
+                pass
+            self.reader_thread.join()
+        super().close()
+
 
 class Indexer:
     tokenizer: Tokenizer
     max_postings_per_temp_block: int
     index_type: str
     use_positions: bool
+    memory_limit: float
+    index_format: str
+    block_file_extension: str
+    workers: int
+    docs_per_batch: int
+    pipelined_reading: bool
+
+    # on incremental indexes the final index blocks are written to segments,
+    # whose postings don't depend on the statistics of the whole collection
+    incremental: bool
+    merge_future: Optional[Future]
     block_posting_count: int
-    inverted_index: DefaultDict[str, List[Posting]]
+    block_position_count: int
+    term_memory_size: int
+    posting_memory_size: int
+    inverted_index: DefaultDict[str, PostingList]
 
-    # contains for each term its document frequency and file number of the
-    # final index blocks
+    # contains for each term its document frequency, file number of the
+    # final index blocks and the byte offset and length of its postings on
+    # that block, followed by the greatest weight of its postings on
+    # weighted indexes
     master_index: DefaultDict[str, List[float]]
 
     # contains the correspondence of surrogate keys to natural keys (the
@@ -32,21 +174,38 @@ class Indexer:
     nr_postings: int
     nr_indexed_docs: int
     indexing_time: float
+    reading_speed: float
     index_size: float
     vocabulary_size: int
     nr_temp_index_segments: int
+    segments_resident_memory: List[float]
+    nr_index_segments: int
 
     def __init__(self, tokenizer: Tokenizer,
                  max_postings_per_temp_block: int = 1000000,
-                 use_positions=False) -> None:
+                 use_positions=False, workers: int = 1,
+                 index_format: str = 'tsv', memory_limit: float = 0,
+                 pipelined_reading: bool = False) -> None:
         field_size_limit(10000000)
         self.tokenizer = tokenizer
         self.max_postings_per_temp_block = max_postings_per_temp_block
         self.block_posting_count = 0
+        self.block_position_count = 0
         self.index_type = 'raw'
         self.use_positions = use_positions
-        self.inverted_index = defaultdict(list)
-        self.master_index = defaultdict(lambda: [0, 0, 0])
+        self.memory_limit = memory_limit
+        self.index_format = index_format
+        self.block_file_extension = BLOCK_FILE_EXTENSIONS[index_format]
+        self.workers = workers
+        self.docs_per_batch = 1000
+        self.pipelined_reading = pipelined_reading
+        self.incremental = False
+        self.merge_future = None
+        self.inverted_index = defaultdict(self.new_posting_list)
+        empty_posting_list_size, self.posting_memory_size = \
+            self.new_posting_list().memory_sizes()
+        self.term_memory_size = TERM_MEMORY_ESTIMATE + empty_posting_list_size
+        self.master_index = defaultdict(lambda: [0, 0, 0, 0])
         self.doc_keys = {}
         self.initialize_statistics()
         self.avdl = 0
@@ -55,9 +214,12 @@ class Indexer:
         self.nr_postings = 0
         self.nr_indexed_docs = 0
         self.indexing_time = 0
+        self.reading_speed = 0
         self.index_size = 0
         self.vocabulary_size = 0
         self.nr_temp_index_segments = 0
+        self.segments_resident_memory = []
+        self.nr_index_segments = 0
 
     def get_statistics(self) -> Dict[str, int]:
         statistics = {
@@ -65,9 +227,19 @@ class Indexer:
             'Number of postings': self.nr_postings,
             'Vocabulary size': self.vocabulary_size,
             'Total indexing time (s)': self.indexing_time,
+            'Documents read and tokenized per second': self.reading_speed,
             'Total index size on disk (MB)': self.index_size,
             'Number of temporary index segments': self.nr_temp_index_segments,
+            'Peak RSS per temporary index segment (MB)': max(
+                self.segments_resident_memory, default=0),
         }
+        if self.incremental:
+            statistics['Number of index segments'] = self.nr_index_segments
+
+        # the documents of a parallel indexing are stemmed by the tokenizers
+        # of the worker processes
+        if self.tokenizer.stemmer_enabled and self.workers == 1:
+            statistics.update(self.tokenizer.get_statistics())
 
         return statistics
 
@@ -79,10 +251,47 @@ class Indexer:
         else:
             self.create_postings(doc_id, doc_body)
 
+    # rough estimate, in bytes, of the memory used by the index block on
+    # memory
+    def estimate_block_memory(self) -> int:
+        return len(self.inverted_index) * self.term_memory_size \
+            + self.block_posting_count * self.posting_memory_size \
+            + self.block_position_count * POSITION_MEMORY_SIZE
+
+    # a temporary index block is dumped to disk when its estimated memory
+    # exceeds the memory limit if one is set, or otherwise when the number of
+    # postings exceeds the maximum
+    def is_temp_block_full(self) -> bool:
+        if self.memory_limit > 0:
+            return self.estimate_block_memory() > self.memory_limit * 1000000
+        else:
+            return self.block_posting_count > self.max_postings_per_temp_block
+
+    # a final index block may only use part of the memory limit, as the
+    # temporary index blocks are read at the same time
+    def is_final_block_full(self) -> bool:
+        if self.memory_limit > 0:
+            return self.estimate_block_memory() \
+                >= self.memory_limit * 1000000 * MERGE_BLOCK_MEMORY_FRACTION
+        else:
+            return self.block_posting_count \
+                >= self.max_postings_per_temp_block
+
+    # the final index blocks and master indexes of the segments of an
+    # incremental index are on its subfolders
     def measure_index_file_size(self, index_folder: str):
-        file_list = glob(index_folder + '/PostingIndexBlock*.tsv')
-        file_list.append(index_folder + '/MasterIndex.tsv')
-        file_list.append(index_folder + '/DocKeys.tsv')
+        file_list = glob(index_folder + '/**/PostingIndexBlock*'
+                         + self.block_file_extension, recursive=True)
+        file_list.extend(glob(index_folder + '/**/MasterIndex.tsv',
+                              recursive=True))
+        file_list.extend(glob(index_folder + '/**/' + LEXICON_FILE_NAME,
+                              recursive=True))
+        if self.index_format == 'binary':
+            file_list.append(path.join(index_folder, DOC_KEYS_DATA_FILE_NAME))
+            file_list.append(path.join(index_folder,
+                                       DOC_KEYS_OFFSETS_FILE_NAME))
+        else:
+            file_list.append(index_folder + '/DocKeys.tsv')
         for file_path in file_list:
             self.index_size += path.getsize(file_path)
         self.index_size = self.index_size / 1000000.0
@@ -91,6 +300,7 @@ class Indexer:
     # index/data_source_filename subfolder
     def index_data_source(self, data_source_path: str) -> None:
         self.initialize_statistics()
+        self.incremental = False
 
         start_time = time()
 
@@ -99,7 +309,83 @@ class Indexer:
             makedirs(index_folder)
 
         self.create_metadata(index_folder)
+        self.read_data_source(data_source_path, index_folder)
+        self.merge_index_blocks(index_folder)
+        self.dump_master_index(index_folder)
+        self.dump_doc_keys(index_folder)
+        end_time = time()
+        self.indexing_time = end_time - start_time
+        self.measure_index_file_size(index_folder)
+        self.vocabulary_size = len(self.master_index)
+
+    # index the documents of a data source into a new segment of an
+    # incremental index, continuing its document IDs. The postings of the
+    # segments don't depend on the statistics of the whole collection, so the
+    # existing segments are kept as they are and only the document
+    # frequencies of the master index are updated. Segments are then merged
+    # on a background thread by a size-tiered policy
+    def append_data_source(self, data_source_path: str,
+                           index_folder: str) -> None:
+        self.wait_for_merges()
+        self.initialize_statistics()
+        self.incremental = True
+        self.doc_keys = {}
+        self.master_index.clear()
+
+        start_time = time()
+
+        if path.exists(index_folder + '/conf.ini'):
+            self.check_metadata(index_folder)
+        else:
+            makedirs(index_folder, exist_ok=True)
+            self.create_metadata(index_folder)
+
+        generation, segments = read_segments(index_folder)
+        self.nr_indexed_docs = sum(segment.nr_docs for segment in segments)
 
+        segment_name = self.new_segment_name(segments)
+        segment_folder = path.join(index_folder, segment_name)
+        if path.exists(segment_folder):
+            rmtree(segment_folder)
+        makedirs(segment_folder)
+
+        self.read_data_source(data_source_path, segment_folder)
+        self.merge_index_blocks(segment_folder)
+        self.dump_master_index(segment_folder)
+        self.dump_doc_keys(index_folder)
+
+        # the new segment is only visible to searchers once the segments
+        # file is replaced
+        segments.append(Segment(segment_name, len(self.doc_keys),
+                                self.nr_postings, self.total_doc_length()))
+        self.vocabulary_size = self.dump_global_master_index(index_folder,
+                                                             segments)
+        write_segments(index_folder, generation + 1, segments)
+        self.nr_index_segments = len(segments)
+
+        end_time = time()
+        self.indexing_time = end_time - start_time
+        self.measure_index_file_size(index_folder)
+
+        merge_executor = ThreadPoolExecutor(max_workers=1)
+        self.merge_future = merge_executor.submit(
+            merge_index_segments, type(self), self.get_tokenizer_arguments(),
+            self.get_worker_arguments(), index_folder)
+        merge_executor.shutdown(wait=False)
+
+    # wait for the segments merged in the background after an append, which
+    # raises any error of the merge
+    def wait_for_merges(self) -> None:
+        if self.merge_future is not None:
+            merge_future = self.merge_future
+            self.merge_future = None
+            merge_future.result()
+
+    # read the documents of a data source and index them to temporary index
+    # blocks on the given folder. With pipelined reading the data source is
+    # decompressed on a separate thread
+    def read_data_source(self, data_source_path: str,
+                         index_folder: str) -> None:
         # define the dialect used by csv.reader to correctly interpret amazon
         # review data files
         dialect = unix_dialect()
@@ -107,149 +393,424 @@ class Indexer:
         dialect.quoting = QUOTE_NONE
         dialect.escapechar = None
 
-        with gzip.open(data_source_path, mode='rt', encoding='utf8',
-                       newline='') as data_file:
-            data_reader = reader(data_file, dialect)
+        start_time = time()
+        nr_indexed_docs = self.nr_indexed_docs
+        with gzip.open(data_source_path, mode='rb') as compressed_file:
+            if self.pipelined_reading:
+                binary_file = BufferedReader(
+                    BackgroundReader(compressed_file))
+            else:
+                binary_file = compressed_file
 
-            # skip the first line (the header)
-            data_file.readline()
+            with TextIOWrapper(binary_file, encoding='utf8',
+                               newline='') as data_file:
+                data_reader = reader(data_file, dialect)
 
-            for doc in data_reader:
+                # skip the first line (the header)
+                data_file.readline()
+
+                if self.workers > 1:
+                    self.index_documents_parallel(data_reader, index_folder)
+                else:
+                    self.index_documents(data_reader, index_folder)
 
-                # index document to memory
-                doc_id, doc_body = self.parse_doc_from_data_source(doc)
-                self.parse_datasource_doc_to_memory(doc_id, doc_body)
+        # the documents of an append continue the IDs of the index
+        reading_time = time() - start_time
+        if reading_time > 0:
+            self.reading_speed = \
+                (self.nr_indexed_docs - nr_indexed_docs) / reading_time
 
-                # dump temporary index block to disk if maximum postings limit
-                # is exceeded
-                if self.block_posting_count > self.max_postings_per_temp_block:
+    # index every document of the data source on this process, dumping a
+    # temporary index block whenever the postings limit is exceeded
+    def index_documents(self, data_reader: Iterable[List[str]],
+                        index_folder: str) -> None:
+        for doc in data_reader:
 
-                    self.nr_temp_index_segments += 1
-                    block_file_path = '{}/TempBlock{}.tsv'.format(
-                        index_folder, self.nr_temp_index_segments)
-                    self.dump_index_to_disk(block_file_path)
+            # index document to memory
+            doc_id, doc_body = self.parse_doc_from_data_source(doc)
+            self.parse_datasource_doc_to_memory(doc_id, doc_body)
 
-            # if the maximum wasn't exceeded and the index isn't empty, make a
-            # final dump to disk
-            if len(self.inverted_index.keys()) > 0:
+            # dump temporary index block to disk if maximum postings or
+            # memory limit is exceeded
+            if self.is_temp_block_full():
 
+                self.segments_resident_memory.append(get_resident_memory())
                 self.nr_temp_index_segments += 1
-                block_file_path = '{}/TempBlock{}.tsv'.format(
-                    index_folder,
-                    self.nr_temp_index_segments)
+                block_file_path = '{}/TempBlock{}{}'.format(
+                    index_folder, self.nr_temp_index_segments,
+                    self.block_file_extension)
                 self.dump_index_to_disk(block_file_path)
 
-        self.merge_index_blocks(index_folder)
-        self.dump_master_index(index_folder)
-        self.dump_doc_keys(index_folder)
-        end_time = time()
-        self.indexing_time = end_time - start_time
-        self.measure_index_file_size(index_folder)
-        self.vocabulary_size = len(self.master_index)
+        # if the maximum wasn't exceeded and the index isn't empty, make a
+        # final dump to disk
+        if len(self.inverted_index.keys()) > 0:
+
+            self.segments_resident_memory.append(get_resident_memory())
+            self.nr_temp_index_segments += 1
+            block_file_path = '{}/TempBlock{}{}'.format(
+                index_folder,
+                self.nr_temp_index_segments,
+                self.block_file_extension)
+            self.dump_index_to_disk(block_file_path)
+
+    # the documents are read and given their surrogate keys on this process,
+    # and then sent in batches of consecutive documents to the worker
+    # processes, which tokenize them and dump their own temporary index
+    # blocks. The blocks are renumbered in the order of the batches, so that
+    # the postings of each term remain ordered by document ID when the blocks
+    # are merged
+    def index_documents_parallel(self, data_reader: Iterable[List[str]],
+                                 index_folder: str) -> None:
+        with ProcessPoolExecutor(
+                max_workers=self.workers, initializer=initialize_worker,
+                initargs=(type(self), self.get_tokenizer_arguments(),
+                          self.get_worker_arguments())) as executor:
+
+            # only a limited number of batches is kept in flight, so that
+            # the data source isn't read into memory faster than it's indexed
+            pending_batches = deque()
+            nr_batches = 0
+            batch = []
+            for doc in data_reader:
+                batch.append(self.parse_doc_from_data_source(doc))
+
+                if len(batch) >= self.docs_per_batch:
+                    nr_batches += 1
+                    pending_batches.append(executor.submit(
+                        index_worker_batch, nr_batches, batch, index_folder))
+                    batch = []
+
+                    if len(pending_batches) >= 2 * self.workers:
+                        self.collect_batch_blocks(
+                            pending_batches.popleft().result(), index_folder)
+
+            if len(batch) > 0:
+                nr_batches += 1
+                pending_batches.append(executor.submit(
+                    index_worker_batch, nr_batches, batch, index_folder))
+
+            while len(pending_batches) > 0:
+                self.collect_batch_blocks(pending_batches.popleft().result(),
+                                          index_folder)
+
+    # index a batch of documents on a worker process, returning the paths of
+    # the temporary index blocks created, the number of postings, the fields
+    # added to the document keys of each document, the resident memory of the
+    # process when each block was dumped and the estimated memory that the
+    # whole batch would use in a single block
+    def index_batch(self, batch_nr: int, docs: List[Tuple[int, str]],
+                    index_folder: str) -> Tuple[List[str], int,
+                                                Dict[int, List[str]],
+                                                List[float], int]:
+        self.nr_postings = 0
+        self.doc_keys = {}
+        self.segments_resident_memory = []
+        block_file_paths = []
+        batch_memory = 0
+
+        for doc_id, doc_body in docs:
+            self.doc_keys[doc_id] = []
+            self.parse_datasource_doc_to_memory(doc_id, doc_body)
+
+            if self.is_temp_block_full():
+                self.segments_resident_memory.append(get_resident_memory())
+                batch_memory += self.estimate_block_memory()
+                block_file_paths.append('{}/TempBatch{}Block{}{}'.format(
+                    index_folder, batch_nr, len(block_file_paths) + 1,
+                    self.block_file_extension))
+                self.dump_index_to_disk(block_file_paths[-1])
+
+        if len(self.inverted_index.keys()) > 0:
+            self.segments_resident_memory.append(get_resident_memory())
+            batch_memory += self.estimate_block_memory()
+            block_file_paths.append('{}/TempBatch{}Block{}{}'.format(
+                index_folder, batch_nr, len(block_file_paths) + 1,
+                self.block_file_extension))
+            self.dump_index_to_disk(block_file_paths[-1])
+
+        return block_file_paths, self.nr_postings, self.doc_keys, \
+            self.segments_resident_memory, batch_memory
+
+    # give the temporary index blocks of a batch their final numbers and add
+    # its statistics to the ones of the whole index
+    def collect_batch_blocks(self, batch_result: Tuple[List[str], int,
+                                                       Dict[int, List[str]],
+                                                       List[float], int],
+                             index_folder: str) -> None:
+        block_file_paths, nr_postings, doc_keys, segments_resident_memory, \
+            batch_memory = batch_result
+        for block_file_path in block_file_paths:
+            self.nr_temp_index_segments += 1
+            replace(block_file_path, '{}/TempBlock{}{}'.format(
+                index_folder, self.nr_temp_index_segments,
+                self.block_file_extension))
+
+        self.nr_postings += nr_postings
+        self.segments_resident_memory.extend(segments_resident_memory)
+        for doc_id in doc_keys:
+            self.doc_keys[doc_id].extend(doc_keys[doc_id])
+
+        # size the next batches so that each one fills a temporary block
+        if self.memory_limit > 0 and batch_memory > 0:
+            self.docs_per_batch = max(1, int(
+                self.memory_limit * 1000000 * len(doc_keys) / batch_memory))
+        elif nr_postings > 0:
+            self.docs_per_batch = max(1, int(
+                self.max_postings_per_temp_block * len(doc_keys)
+                / nr_postings))
 
-    # merge temporary index blocks and create the final index blocks
+    # arguments needed to create an equivalent tokenizer on another process
+    # or thread
+    def get_tokenizer_arguments(self) -> Dict[str, Any]:
+        return {
+            'stopwords_path': self.tokenizer.stopwords_path,
+            'stemmer_enabled': self.tokenizer.stemmer_enabled,
+            'size_filter': self.tokenizer.size_filter,
+            'stem_cache_size': self.tokenizer.stem_cache_size,
+            'batch_stemming': self.tokenizer.batch_stemming,
+            'engine': self.tokenizer.engine,
+        }
+
+    # arguments needed to create an equivalent indexer on a worker process
+    def get_worker_arguments(self) -> Dict[str, Any]:
+        return {
+            'max_postings_per_temp_block': self.max_postings_per_temp_block,
+            'use_positions': self.use_positions,
+            'index_format': self.index_format,
+            'memory_limit': self.memory_limit,
+        }
+
+    # merge temporary index blocks and create the final index blocks. The
+    # blocks are merged in a single pass by a priority queue keyed by term,
+    # which holds only the current row of each temporary block, so the
+    # memory used doesn't depend on the number of blocks
     def merge_index_blocks(self, index_blocks_folder: str) -> None:
         file_path_list = []
-        last_term_list = []
-
-        # temporary dictionary of terms that were read from each temporary
-        # index block. The key is the block number while the value is
-        # its inverted index as a dictionary
-        temp_merge_dict = defaultdict(dict)
 
         # prepare list of block file paths
         for block_number in range(1, self.nr_temp_index_segments + 1):
-            file_path_list.append('{}/TempBlock{}.tsv'.format(
-                index_blocks_folder, block_number))
+            file_path_list.append('{}/TempBlock{}{}'.format(
+                index_blocks_folder, block_number, self.block_file_extension))
+
+        file_mode = 'rb' if self.index_format == 'binary' else 'rt'
+
+        # with a memory limit, the part of it not used by the final index
+        # block is split between the read buffers of the temporary blocks
+        read_ahead_per_block = -1
+        if self.memory_limit > 0 and self.nr_temp_index_segments > 0:
+            read_ahead_per_block = max(DEFAULT_BUFFER_SIZE, int(
+                self.memory_limit * 1000000
+                * (1 - MERGE_BLOCK_MEMORY_FRACTION)
+                / self.nr_temp_index_segments))
 
         with ExitStack() as stack:
 
-            block_files = [stack.enter_context(open(file_path))
-                           for file_path in file_path_list]
-            file_readers = [reader(block_file, delimiter='\t')
-                            for block_file in block_files]
-
-            # the maximum number of postings read per block is 70% of the total
-            # divided by the number of temporary index blocks
-            max_postings_read_per_block = int(
-                (self.max_postings_per_temp_block
-                    / self.nr_temp_index_segments) * 0.7)
-
-            nr_final_index_blocks = 1
-            self.block_posting_count = 0
-            nr_merged_postings = 0
-
-            while(nr_merged_postings < self.nr_postings):
-
-                last_term_list.clear()
-
-                # read terms from each temporary index block until the maximum
-                # number of postings is exceeded
-                for block_nr in range(0, self.nr_temp_index_segments):
-
-                    nr_postings_read = 0
-                    while nr_postings_read < max_postings_read_per_block:
-                        try:
-                            row = next(file_readers[block_nr])
-                        except StopIteration:
-                            break
-                        term, value = self.parse_disk_term_to_memory(row)
-                        temp_merge_dict[block_nr + 1][term] = value
-                        nr_postings_read += len(value)
-
-                    last_term_list.append(term)
-
-                # of the last terms read on each block, the lexicographically
-                # lowest term will be the last to be merged, while the others
-                # remain in memory for the next iteration
-                last_term_list.sort()
-                last_term_to_merge = last_term_list[0]
-
-                # merge on memory all terms in the temporary dictionary of read
-                # terms from each block that are ready to be merged
-                for block_nr in range(1, self.nr_temp_index_segments + 1):
-
-                    block_terms = list(temp_merge_dict[block_nr].keys())
-
-                    for term in block_terms:
-
-                        if term <= last_term_to_merge:
-
-                            nr_postings_for_term = len(
-                                temp_merge_dict[block_nr][term])
-                            self.block_posting_count += nr_postings_for_term
-                            postings = temp_merge_dict[block_nr].pop(term)
-                            for posting in postings:
-                                self.inverted_index[term].append(posting)
-
-                            nr_merged_postings += nr_postings_for_term
-                            self.add_term_to_master_index(
-                                term, nr_postings_for_term,
-                                nr_final_index_blocks)
-
-                # dump to disk if the number of postings on the final index on
-                # memory exceeds the maximum per block
-                if self.block_posting_count \
-                        >= self.max_postings_per_temp_block:
-                    block_file_path = '{}/PostingIndexBlock{}.tsv'.format(
-                        index_blocks_folder,
-                        nr_final_index_blocks)
-                    self.final_indexing_calculations()
-                    self.dump_index_to_disk(block_file_path)
-                    nr_final_index_blocks += 1
-
-            # if the maximum wasn't exceeded and the index isn't empty, make a
-            # final dump to disk
-            if len(self.inverted_index.keys()) > 0:
-                block_file_path = '{}/PostingIndexBlock{}.tsv'.format(
-                    index_blocks_folder,
-                    nr_final_index_blocks)
-                self.final_indexing_calculations()
-                self.dump_index_to_disk(block_file_path)
+            block_files = [stack.enter_context(
+                open(file_path, file_mode, buffering=read_ahead_per_block))
+                for file_path in file_path_list]
+            block_rows = [self.read_index_block_rows(block_nr, block_file)
+                          for block_nr, block_file in enumerate(block_files)]
+            if not self.incremental:
+                self.calculate_collection_statistics()
+            self.write_final_index_blocks(block_rows, index_blocks_folder)
+
+    # merge the rows of index blocks, each stream ordered by term and with
+    # greater document IDs than the previous streams, into the final index
+    # blocks of a folder
+    def write_final_index_blocks(
+            self, block_rows: List[Iterator[Tuple[str, int, PostingList]]],
+            index_blocks_folder: str) -> None:
+        nr_final_index_blocks = 1
+        self.block_posting_count = 0
+        self.block_position_count = 0
+
+        # equal terms come out of the queue in block order, which is also
+        # document order, so their postings are simply concatenated
+        for term, term_rows in groupby(merge(*block_rows), key=itemgetter(0)):
+
+            _, _, postings = next(term_rows)
+            for _, _, block_postings in term_rows:
+                postings.extend(block_postings)
+            self.inverted_index[term] = postings
+
+            nr_postings_for_term = len(postings)
+            self.block_posting_count += nr_postings_for_term
+            if self.use_positions:
+                self.block_position_count += len(postings.positions)
+            self.add_term_to_master_index(
+                term, nr_postings_for_term, nr_final_index_blocks)
+
+            # dump to disk if the number of postings or the memory of the
+            # final index on memory exceeds the maximum per block. As this
+            # only depends on the merged terms, the final index blocks don't
+            # depend on how the temporary blocks were split
+            if self.is_final_block_full():
+                self.dump_final_index_block(index_blocks_folder,
+                                            nr_final_index_blocks)
+                nr_final_index_blocks += 1
+
+        # if the maximum wasn't exceeded and the index isn't empty, make a
+        # final dump to disk
+        if len(self.inverted_index.keys()) > 0:
+            self.dump_final_index_block(index_blocks_folder,
+                                        nr_final_index_blocks)
+
+    # the weights of the postings of incremental indexes are left as they
+    # were calculated for each document, and the master index of the segment
+    # keeps the document frequencies
+    def dump_final_index_block(self, index_blocks_folder: str,
+                               block_nr: int) -> None:
+        block_file_path = '{}/PostingIndexBlock{}{}'.format(
+            index_blocks_folder, block_nr, self.block_file_extension)
+        if not self.incremental:
+            self.final_indexing_calculations()
+        self.add_offsets_to_master_index(
+            self.dump_index_to_disk(block_file_path))
+
+    # merge the segments selected by the merge policy until there are none
+    # left to merge. Each merged segment replaces its segments on the
+    # segments file, and only then are they listed as obsolete, so their
+    # folders are removed by a later merge
+    def merge_segments(self, index_folder: str) -> None:
+        self.incremental = True
+        generation, segments = read_segments(index_folder)
+        obsolete_segments = self.remove_obsolete_segments(index_folder,
+                                                          generation)
+
+        selected_segments = select_segments_to_merge(segments)
+        while selected_segments is not None:
+            start, end = selected_segments
+            merged_segment = self.merge_segment_blocks(index_folder,
+                                                       segments[start:end],
+                                                       segments)
+            removed_segments = segments[start:end]
+            segments[start:end] = [merged_segment]
+            generation += 1
+            write_segments(index_folder, generation, segments)
+            obsolete_segments.extend((segment.name, generation)
+                                     for segment in removed_segments)
+            write_obsolete_segments(index_folder, obsolete_segments)
+
+            selected_segments = select_segments_to_merge(segments)
+
+        self.nr_index_segments = len(segments)
+
+    # remove the folders of the obsolete segments left out by a generation
+    # before the current one, which searchers no longer read once they see
+    # the current segments file, and return the remaining obsolete segments
+    def remove_obsolete_segments(self, index_folder: str,
+                                 generation: int) -> List[Tuple[str, int]]:
+        obsolete_segments = read_obsolete_segments(index_folder)
+        remaining_segments = []
+        for segment_name, obsolete_generation in obsolete_segments:
+            if obsolete_generation < generation:
+                rmtree(path.join(index_folder, segment_name),
+                       ignore_errors=True)
+            else:
+                remaining_segments.append((segment_name, obsolete_generation))
+        if len(remaining_segments) < len(obsolete_segments):
+            write_obsolete_segments(index_folder, remaining_segments)
+        return remaining_segments
+
+    # merge the final index blocks of adjacent segments into a new segment.
+    # The blocks of each segment are read in order, so each segment is a
+    # single stream of rows ordered by term
+    def merge_segment_blocks(self, index_folder: str,
+                             merged_segments: List[Segment],
+                             segments: List[Segment]) -> Segment:
+        segment_name = self.new_segment_name(segments)
+        segment_folder = path.join(index_folder, segment_name)
+        if path.exists(segment_folder):
+            rmtree(segment_folder)
+        makedirs(segment_folder)
+
+        self.master_index.clear()
+        file_mode = 'rb' if self.index_format == 'binary' else 'rt'
+
+        with ExitStack() as stack:
+
+            segment_rows = []
+            for segment_nr, segment in enumerate(merged_segments):
+                nr_blocks = len(glob(path.join(
+                    index_folder, segment.name,
+                    'PostingIndexBlock*' + self.block_file_extension)))
+                block_files = [stack.enter_context(open(
+                    '{}/{}/PostingIndexBlock{}{}'.format(
+                        index_folder, segment.name, block_nr,
+                        self.block_file_extension), file_mode))
+                    for block_nr in range(1, nr_blocks + 1)]
+                segment_rows.append(chain.from_iterable([
+                    self.read_index_block_rows(segment_nr, block_file)
+                    for block_file in block_files]))
+
+            self.write_final_index_blocks(segment_rows, segment_folder)
+
+        self.dump_master_index(segment_folder)
+
+        return Segment(
+            segment_name,
+            sum(segment.nr_docs for segment in merged_segments),
+            sum(segment.nr_postings for segment in merged_segments),
+            sum(segment.total_doc_length for segment in merged_segments))
+
+    # segments are numbered in the order they are created
+    def new_segment_name(self, segments: List[Segment]) -> str:
+        segment_numbers = [int(segment.name[len('Segment'):])
+                           for segment in segments]
+        return 'Segment{}'.format(max(segment_numbers, default=0) + 1)
+
+    # the master index of an incremental index has for each term the same
+    # value as the master index of a non-incremental index on its first
+    # column, followed by its document frequency. The master indexes of the
+    # segments are merged like the index blocks, as they are ordered by term.
+    # Returns the number of terms
+    def dump_global_master_index(self, index_folder_path: str,
+                                 segments: List[Segment]) -> int:
+        nr_terms = 0
+        lexicon_rows = []
+        file_path = index_folder_path + '/MasterIndex.tsv'
+        with ExitStack() as stack:
+            segment_rows = [reader(stack.enter_context(open(
+                path.join(index_folder_path, segment.name, 'MasterIndex.tsv'),
+                mode='rt', encoding='utf8', newline='')), delimiter='\t')
+                for segment in segments]
+
+            master_index_file = stack.enter_context(open(
+                file_path + '.tmp', mode='wt', encoding='utf8', newline=''))
+            file_writer = writer(master_index_file, delimiter='\t')
+            for term, term_rows in groupby(merge(*segment_rows,
+                                                 key=itemgetter(0)),
+                                           key=itemgetter(0)):
+                df = sum(int(row[1]) for row in term_rows)
+                master_index_row = [term, self.master_index_value(df), df]
+                file_writer.writerow(master_index_row)
+                if self.index_format == 'binary':
+                    lexicon_rows.append(master_index_row)
+                nr_terms += 1
+        replace(file_path + '.tmp', file_path)
+        if self.index_format == 'binary':
+            write_lexicon(path.join(index_folder_path, LEXICON_FILE_NAME),
+                          lexicon_rows)
+
+        return nr_terms
+
+    # stream the rows of a temporary index block as tuples of term, block
+    # number and postings, ordered by term as they were written
+    def read_index_block_rows(self, block_nr: int,
+                              block_file: Union[TextIO, BinaryIO]
+                              ) -> Iterator[Tuple[str, int, PostingList]]:
+        if self.index_format == 'binary':
+            for term, posting_list_bytes in read_binary_records(block_file):
+                yield term, block_nr, self.posting_list_from_bytes(
+                    posting_list_bytes)
+        else:
+            for row in reader(block_file, delimiter='\t'):
+                term, postings = self.parse_disk_term_to_memory(row)
+                yield term, block_nr, postings
 
     # process the contents of an index file for indexing in memory again
     def parse_disk_term_to_memory(self,
-                                  row: List[str]) -> Tuple[str, List[Posting]]:
+                                  row: List[str]) -> Tuple[str, PostingList]:
         term = row[0]
         posting_str_list = row[1:]
         posting_list = self.posting_list_from_str(posting_str_list)
@@ -274,25 +835,55 @@ class Indexer:
     # each row, and a posting on each subsequent column, as its document ID.
     # When positions are being considered for the index, each posting will be a
     # string containing the document ID followed by the character ':' and the
-    # list of positions on the document separated by ','
-    def dump_index_to_disk(self, file_path: str) -> None:
-        with open(file_path, mode='wt', encoding='utf8',
-                  newline='') as block_file:
-            block_writer = writer(block_file, delimiter='\t')
+    # list of positions on the document separated by ','. On the binary
+    # format each term is followed by its encoded posting list instead.
+    # Returns for each term the byte offset and length of its row on the TSV
+    # format, or of its encoded posting list on the binary format
+    def dump_index_to_disk(self, file_path: str
+                           ) -> Dict[str, Tuple[int, int]]:
+        ordered_terms = list(self.inverted_index.keys())
+        list.sort(ordered_terms)
+        term_offsets = {}
+        offset = 0
 
-            ordered_terms = list(self.inverted_index.keys())
-            list.sort(ordered_terms)
-            for block_term in ordered_terms:
-                row = [block_term]
-                for posting in self.inverted_index[block_term]:
-                    row.append(posting.to_string())
-                block_writer.writerow(row)
+        if self.index_format == 'binary':
+            with open(file_path, mode='wb') as block_file:
+                for block_term in ordered_terms:
+                    posting_list_bytes = \
+                        self.inverted_index[block_term].to_bytes()
+                    header_length = write_binary_record(
+                        block_file, block_term, posting_list_bytes)
+                    term_offsets[block_term] = (offset + header_length,
+                                                len(posting_list_bytes))
+                    offset += header_length + len(posting_list_bytes)
+        else:
+            # each row is written by the CSV writer to a buffer first, so that
+            # its size in bytes is known
+            row_buffer = StringIO(newline='')
+            row_writer = writer(row_buffer, delimiter='\t')
+            with open(file_path, mode='wb') as block_file:
+
+                for block_term in ordered_terms:
+                    row = [block_term] \
+                        + self.inverted_index[block_term].to_strings()
+                    row_writer.writerow(row)
+                    row_bytes = row_buffer.getvalue().encode('utf8')
+                    row_buffer.seek(0)
+                    row_buffer.truncate()
+
+                    block_file.write(row_bytes)
+                    term_offsets[block_term] = (offset, len(row_bytes))
+                    offset += len(row_bytes)
         self.block_posting_count = 0
+        self.block_position_count = 0
         self.inverted_index.clear()
 
+        return term_offsets
+
     # the resulting TSV file on disk will have a term on the first column of
-    # each row, followed on each column by its document frequency and the block
-    # number of the final index where it can be found
+    # each row, followed on each column by its document frequency, the block
+    # number of the final index where it can be found and the byte offset and
+    # length of its postings on that block
     def dump_master_index(self, index_folder_path):
         file_path = index_folder_path + '/MasterIndex.tsv'
         with open(file_path, mode='wt', encoding='utf8',
@@ -303,67 +894,197 @@ class Indexer:
             keys.sort()
             for key in keys:
                 file_writer.writerow(
-                    [key, self.master_index[key][0], self.master_index[key][1]]
+                    [key] + self.master_index[key]
                 )
 
+        # binary indexes also have the master index as a lexicon for the
+        # searcher
+        if self.index_format == 'binary':
+            write_lexicon(path.join(index_folder_path, LEXICON_FILE_NAME),
+                          ([key] + self.master_index[key] for key in keys))
+
     # the resulting TSV file on disk will have the surrogate key on each row,
-    # followed by the natural key (hexadecimal) on the next column
+    # followed by the natural key (hexadecimal) on the next column. The
+    # documents of incremental indexes are appended to the file, with the
+    # document length of BM25 indexes on the last column. Binary indexes keep
+    # the same fields on a memory mappable document key store instead
     def dump_doc_keys(self, index_folder_path: str) -> None:
+        if self.index_format == 'binary':
+            if self.incremental:
+                doc_keys_rows = self.doc_keys.values()
+            else:
+                doc_keys_rows = (self.doc_keys[key][0:2]
+                                 for key in self.doc_keys)
+            write_doc_keys(index_folder_path, doc_keys_rows,
+                           append=self.incremental)
+            return
+
         file_path = index_folder_path + '/DocKeys.tsv'
-        with open(file_path, mode='wt', encoding='utf8',
+        file_mode = 'at' if self.incremental else 'wt'
+        with open(file_path, mode=file_mode, encoding='utf8',
                   newline='') as doc_keys_file:
             file_writer = writer(doc_keys_file, delimiter='\t')
             ordered_terms = list(self.inverted_index.keys())
             list.sort(ordered_terms)
             for key in self.doc_keys:
-                file_writer.writerow([str(key)] + self.doc_keys[key][0:2])
+                if self.incremental:
+                    file_writer.writerow([str(key)] + self.doc_keys[key])
+                else:
+                    file_writer.writerow([str(key)] + self.doc_keys[key][0:2])
 
+    # the document frequency of a term is complete once its postings are
+    # merged, and the number of documents is known before the merge, so the
+    # value of each term on the master index of a final index, such as its
+    # IDF, is calculated only once. The master index of a segment keeps the
+    # document frequency
     def add_term_to_master_index(self, term, nr_postings_for_term,
                                  nr_final_index_blocks):
-        self.master_index[term][0] += nr_postings_for_term
+        if self.incremental:
+            self.master_index[term][0] = nr_postings_for_term
+        else:
+            self.master_index[term][0] = \
+                self.master_index_value(nr_postings_for_term)
         self.master_index[term][1] = nr_final_index_blocks
 
+    def add_offsets_to_master_index(
+            self, term_offsets: Dict[str, Tuple[int, int]]) -> None:
+        for term in term_offsets:
+            self.master_index[term][2:4] = term_offsets[term]
+
+    # the greatest weight of the postings of each term of a weighted final
+    # index block is added to the master index, as the upper bound of the
+    # score the term can add to a document, which the searcher uses to skip
+    # documents that can't reach the top results
+    def add_max_impacts_to_master_index(self) -> None:
+        for term in self.inverted_index:
+            self.master_index[term][4:5] = \
+                [max(self.inverted_index[term].weights)]
+
     def get_number_of_words_from_dockeys(self, document):
         return self.doc_keys[document][2]
 
+    # configurations written to the conf.ini file of the index
+    def get_configurations(self) -> Dict[str, str]:
+        return {
+            'index_type': self.index_type,
+            'size_filter': str(self.tokenizer.size_filter),
+            'stemmer_enabled': str(self.tokenizer.stemmer_enabled),
+            'stopwords_path': str(self.tokenizer.stopwords_path),
+            'use_positions': str(self.use_positions),
+            'index_format': self.index_format,
+            'incremental': str(self.incremental),
+        }
+
     def create_metadata(self, index_folder_path):
         ini_file_path = index_folder_path + '/conf.ini'
         with open(ini_file_path, mode='wt', encoding='utf8',
                   newline='') as ini_file:
             file_writer = writer(ini_file, delimiter='\t')
-            file_writer.writerow(['index_type', self.index_type])
-            file_writer.writerow(['size_filter', str(self.tokenizer.size_filter)])
-            file_writer.writerow(['stemmer_enabled', str(self.tokenizer.stemmer_enabled)])
-            file_writer.writerow(['stopwords_path', str(self.tokenizer.stopwords_path)])
-            file_writer.writerow(['use_positions', str(self.use_positions)])
+            configurations = self.get_configurations()
+            for key in configurations:
+                file_writer.writerow([key, configurations[key]])
+
+    # documents can only be appended to an incremental index created with
+    # the same configurations
+    def check_metadata(self, index_folder_path: str) -> None:
+        ini_file_path = index_folder_path + '/conf.ini'
+        with open(ini_file_path, mode='rt', encoding='utf8',
+                  newline='') as ini_file:
+            index_configurations = {row[0]: row[1] for row in
+                                    reader(ini_file, delimiter='\t')}
+
+        configurations = self.get_configurations()
+        for key in configurations:
+            if index_configurations.get(key) != configurations[key]:
+                raise ValueError(
+                    'Cannot append to {}: its {} is {}, not {}'.format(
+                        index_folder_path, key, index_configurations.get(key),
+                        configurations[key]))
+
+    # posting list for a term of the in-memory index
+    def new_posting_list(self) -> PostingList:
+        if self.use_positions:
+            return PostingList(PostingPositional)
+        else:
+            return PostingList(Posting)
 
     def create_postings(self, doc_id: int, doc_body: str) -> None:
         tokens = self.tokenizer.tokenize(doc_body)
         for token in tokens:
-            self.inverted_index[token].append(Posting(doc_id))
+            self.inverted_index[token].add(doc_id)
             self.nr_postings += 1
             self.block_posting_count += 1
 
     def create_postings_positional(self, doc_id: int, doc_body: str) -> None:
         tokens = self.tokenizer.tokenize_positional(doc_body)
         for token in tokens:
-            self.inverted_index[token].append(
-                PostingPositional(doc_id, tokens[token]))
+            self.inverted_index[token].add(doc_id, positions=tokens[token])
             self.nr_postings += 1
             self.block_posting_count += 1
+            self.block_position_count += len(tokens[token])
+
+    # statistics of the whole collection needed by the final indexing
+    # calculations, which are calculated once before the final index blocks
+    # are created
+    def calculate_collection_statistics(self) -> None:
+        pass
 
     def final_indexing_calculations(self) -> None:
-        self.update_dfs()
+        pass
+
+    # value of the first column of the master index for a term with the
+    # given document frequency
+    def master_index_value(self, df: int) -> float:
+        return df
+
+    # sum of the lengths of the indexed documents, for the indexes that need
+    # it to weight the postings
+    def total_doc_length(self) -> int:
+        return 0
 
     def posting_list_from_str(self,
-                              posting_str_list: List[str]) -> List[Posting]:
+                              posting_str_list: List[str]) -> PostingList:
         if self.use_positions:
-            posting_list = [PostingPositional.from_string(posting_str)
-                            for posting_str in posting_str_list]
+            posting_list = PostingList.from_strings(PostingPositional,
+                                                    posting_str_list)
         else:
-            posting_list = [Posting.from_string(posting_str)
-                            for posting_str in posting_str_list]
+            posting_list = PostingList.from_strings(Posting,
+                                                    posting_str_list)
         return posting_list
 
-    def update_dfs(self):
-        pass
+    def posting_list_from_bytes(self,
+                                posting_list_bytes: bytes) -> PostingList:
+        if self.use_positions:
+            return PostingList.from_bytes(PostingPositional,
+                                          posting_list_bytes)
+        else:
+            return PostingList.from_bytes(Posting, posting_list_bytes)
+
+
+# indexer of each worker process of a parallel indexing run
+worker_indexer: Indexer
+
+
+def initialize_worker(indexer_class: type, tokenizer_arguments: Dict[str, Any],
+                      indexer_arguments: Dict[str, Any]) -> None:
+    global worker_indexer
+    worker_indexer = indexer_class(Tokenizer(**tokenizer_arguments),
+                                   **indexer_arguments)
+
+
+def index_worker_batch(batch_nr: int, docs: List[Tuple[int, str]],
+                       index_folder: str) -> Tuple[List[str], int,
+                                                   Dict[int, List[str]],
+                                                   List[float], int]:
+    return worker_indexer.index_batch(batch_nr, docs, index_folder)
+
+
+# segments are merged by their own indexer, so that the one that appended
+# them can still be used while the merge runs
+def merge_index_segments(indexer_class: type,
+                         tokenizer_arguments: Dict[str, Any],
+                         indexer_arguments: Dict[str, Any],
+                         index_folder: str) -> None:
+    indexer = indexer_class(Tokenizer(**tokenizer_arguments),
+                            **indexer_arguments)
+    indexer.merge_segments(index_folder)
@@ -1,7 +1,12 @@
+from csv import reader
 from filecmp import cmpfiles
 from os import listdir, path, remove, scandir
+from shutil import copytree, rmtree
 
+from index_blocks import iterate_binary_records
 from indexer import Indexer
+from postings import (END_OF_POSTINGS, PostingCursor, PostingPositions,
+                      PostingWeightedPositional)
 from tokenizer import Tokenizer
 from indexer_bm25 import IndexerBM25
 from indexer_lnc_ltc import IndexerLncLtc
@@ -30,6 +35,115 @@ def indexer_test(indexer, test_file, reference_index_folder):
     assert len(mismatching_files) + len(error_files) == 0
 
 
+# the final index built with multiple worker processes must be identical to
+# the one built by a single process
+def parallel_indexer_test(serial_indexer, parallel_indexer, test_file):
+
+    test_file_basename = path.splitext(
+        path.splitext(path.basename(test_file))[0])[0]
+    test_index_folder = 'index/' + test_file_basename
+    serial_index_folder = test_index_folder + '_serial'
+
+    for index_folder in [test_index_folder, serial_index_folder]:
+        if path.exists(index_folder):
+            rmtree(index_folder)
+    serial_indexer.index_data_source(test_file)
+    copytree(test_index_folder, serial_index_folder)
+    rmtree(test_index_folder)
+    parallel_indexer.index_data_source(test_file)
+
+    final_file_list = [file for file in listdir(serial_index_folder)
+                       if not file.startswith('TempBlock')]
+
+    matching_files, mismatching_files, error_files = cmpfiles(
+        test_index_folder,
+        serial_index_folder,
+        final_file_list, shallow=False)
+
+    assert len(mismatching_files) + len(error_files) == 0
+
+
+# appending the same data source twice to an incremental index must continue
+# its document IDs and double the document frequency of every term
+def incremental_indexer_test(indexer, test_file, test_index_folder):
+
+    if path.exists(test_index_folder):
+        rmtree(test_index_folder)
+    indexer.append_data_source(test_file, test_index_folder)
+    indexer.append_data_source(test_file, test_index_folder)
+    indexer.wait_for_merges()
+
+    with open(test_index_folder + '/DocKeys.tsv', newline='') as doc_keys_file:
+        doc_ids = [int(row[0]) for row in reader(doc_keys_file,
+                                                 delimiter='\t')]
+    assert doc_ids == list(range(1, len(doc_ids) + 1))
+
+    with open(test_index_folder + '/Segment1/MasterIndex.tsv',
+              newline='') as segment_master_index_file:
+        segment_dfs = {row[0]: int(row[1]) for row in
+                       reader(segment_master_index_file, delimiter='\t')}
+    with open(test_index_folder + '/MasterIndex.tsv',
+              newline='') as master_index_file:
+        for term, _, df in reader(master_index_file, delimiter='\t'):
+            assert int(df) == 2 * segment_dfs[term]
+
+
+# the cursors over the binary posting lists of the final index must return
+# the same postings as decoding the whole lists, when moved to the next
+# posting and when advanced past the document IDs of each skip block, and
+# the positions of positional lists must be the same when they are decoded
+# separately for each posting and when they are read through the cursors
+def posting_cursor_test(indexer, test_file, posting_class):
+
+    test_file_basename = path.splitext(
+        path.splitext(path.basename(test_file))[0])[0]
+    test_index_folder = 'index/' + test_file_basename
+
+    if path.exists(test_index_folder):
+        rmtree(test_index_folder)
+    indexer.index_data_source(test_file)
+
+    for file in listdir(test_index_folder):
+        if not file.startswith('PostingIndex'):
+            continue
+        with open(path.join(test_index_folder, file), 'rb') as block_file:
+            data = block_file.read()
+        for term, start, end in iterate_binary_records(data):
+            columns, positions_offset = posting_class.columns_from_bytes(
+                data[start:end], positions=False)
+            fields_list = list(zip(*columns[1:])) if len(columns) > 1 \
+                else [()] * len(columns[0])
+            postings = list(zip(columns[0], fields_list))
+
+            if posting_class.is_positional:
+                all_columns, _ = posting_class.columns_from_bytes(
+                    data[start:end])
+                assert all_columns[:-1] == columns
+                positions = PostingPositions(data[start:end],
+                                             positions_offset, columns[0])
+                assert [positions[doc_id] for doc_id in columns[0][::-1]] \
+                    == all_columns[-1][::-1]
+
+                cursor = PostingCursor(posting_class, data[start:end])
+                for doc_id, doc_positions in list(zip(
+                        columns[0], all_columns[-1]))[::5]:
+                    assert cursor.advance(doc_id) == doc_id
+                    assert cursor.positions() == doc_positions
+
+            cursor = PostingCursor(posting_class, data[start:end])
+            cursor_postings = []
+            while cursor.next() != END_OF_POSTINGS:
+                cursor_postings.append((cursor.doc_id, cursor.fields()))
+            assert cursor_postings == postings
+
+            cursor = PostingCursor(posting_class, data[start:end])
+            for doc_id, fields in postings[::7]:
+                assert cursor.advance(doc_id - 1) <= doc_id
+                assert cursor.advance(doc_id) == doc_id
+                assert cursor.fields() == fields
+            assert cursor.advance(postings[-1][0] + 1) == END_OF_POSTINGS
+
+
 # # nonpositional raw index unit test
 # tokenizer = Tokenizer(stopwords_path='', stemmer_enabled=True, size_filter=0)
 # indexer = Indexer(tokenizer, 30)
@@ -98,6 +212,39 @@ def indexer_test(indexer, test_file, reference_index_folder):
 # indexer_test(indexer, test_file, reference_index_folder)
 
 
+# # positional BM25 parallel index unit test
+# tokenizer = Tokenizer(stopwords_path='content/stopwords.txt',
+#                       stemmer_enabled=True, size_filter=3)
+# serial_indexer = IndexerBM25(tokenizer, max_postings_per_temp_block=30,
+#                              use_positions=True)
+# parallel_indexer = IndexerBM25(tokenizer, max_postings_per_temp_block=30,
+#                                use_positions=True, workers=3)
+
+# test_file = 'content/amazon_reviews_us_Digital_Video_Games_v1_00_sample.tsv.gz'
+
+# parallel_indexer_test(serial_indexer, parallel_indexer, test_file)
+
+
+# # positional BM25 incremental index unit test
+# tokenizer = Tokenizer(stopwords_path='content/stopwords.txt',
+#                       stemmer_enabled=True, size_filter=3)
+# indexer = IndexerBM25(tokenizer, use_positions=True)
+
+# test_file = 'content/data1.tsv.gz'
+
+# incremental_indexer_test(indexer, test_file, 'index/data1_incremental')
+
+
+# # positional BM25 binary posting cursor unit test
+# tokenizer = Tokenizer(stopwords_path='content/stopwords.txt',
+#                       stemmer_enabled=True, size_filter=3)
+# indexer = IndexerBM25(tokenizer, use_positions=True, index_format='binary')
+
+# test_file = 'content/data1.tsv.gz'
+
+# posting_cursor_test(indexer, test_file, PostingWeightedPositional)
+
+
 # positional lnc.ltc weighted index unit test
 tokenizer = Tokenizer(stopwords_path='content/stopwords.txt',
                       stemmer_enabled=True, size_filter=3)
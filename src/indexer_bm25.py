@@ -1,8 +1,9 @@
-from typing import Dict, List
+from array import array
+from typing import Any, Dict, List
 from math import log10
 
 from indexer import Indexer
-from postings import PostingWeighted, PostingWeightedPositional
+from postings import PostingList, PostingWeighted, PostingWeightedPositional
 from tokenizer import Tokenizer
 
 
@@ -12,17 +13,37 @@ class IndexerBM25(Indexer):
     avdl: float
     logarithm: Dict[int, float]
 
+    # length of each document and the length normalization of BM25 for it,
+    # k * ((1 - b) + b * dl / avdl), indexed by document ID
+    doc_lengths: array
+    length_norms: array
+
     def __init__(self, tokenizer: Tokenizer, k: float = 1.2, b: float = 0.75,
                  max_postings_per_temp_block: int = 1000000,
-                 use_positions=False) -> None:
+                 use_positions=False, workers: int = 1,
+                 index_format: str = 'tsv', memory_limit: float = 0,
+                 pipelined_reading: bool = False) -> None:
         super().__init__(tokenizer, max_postings_per_temp_block,
-                         use_positions=use_positions)
+                         use_positions=use_positions, workers=workers,
+                         index_format=index_format, memory_limit=memory_limit,
+                         pipelined_reading=pipelined_reading)
         self.k = k
         self.b = b
         self.avdl = 0
+        self.doc_lengths = array('I')
+        self.length_norms = array('d')
         self.logarithm = {}
         self.index_type = 'bm25'
 
+    # the weights of the postings are the term frequencies until the final
+    # index blocks are created
+    def new_posting_list(self) -> PostingList:
+        if self.use_positions:
+            return PostingList(PostingWeightedPositional,
+                               weight_type_code='I')
+        else:
+            return PostingList(PostingWeighted, weight_type_code='I')
+
     def create_postings(self, doc_id: int, doc_body: str) -> None:
         tokens = self.tokenizer.tokenize_positional(doc_body)
         dl = 0
@@ -31,7 +52,7 @@ class IndexerBM25(Indexer):
         self.doc_keys[doc_id].append(str(dl))
         for token in tokens:
             tf = len(tokens[token])
-            self.inverted_index[token].append(PostingWeighted(doc_id, tf))
+            self.inverted_index[token].add(doc_id, tf)
             self.nr_postings += 1
             self.block_posting_count += 1
 
@@ -43,52 +64,82 @@ class IndexerBM25(Indexer):
         self.doc_keys[doc_id].append(str(dl))
         for token in tokens:
             tf = len(tokens[token])
-            self.inverted_index[token].append(
-                PostingWeightedPositional(doc_id, tf, tokens[token]))
+            self.inverted_index[token].add(doc_id, tf, tokens[token])
             self.nr_postings += 1
             self.block_posting_count += 1
+            self.block_position_count += len(tokens[token])
+
+    def get_worker_arguments(self) -> Dict[str, Any]:
+        worker_arguments = super().get_worker_arguments()
+        worker_arguments['k'] = self.k
+        worker_arguments['b'] = self.b
+        return worker_arguments
+
+    # the searcher needs k and b to weight the term frequencies of the
+    # segments of incremental indexes
+    def get_configurations(self) -> Dict[str, str]:
+        configurations = super().get_configurations()
+        configurations['k'] = str(self.k)
+        configurations['b'] = str(self.b)
+        return configurations
 
     def final_indexing_calculations(self) -> None:
-        self.update_dfs()
-        self.calculate_avdl()
         self.calculate_weights()
+        self.add_max_impacts_to_master_index()
 
-    def calculate_avdl(self):
-        sum_of_documents_length = 0
-        ndocs = 0
-        for docs in self.doc_keys.keys():
-            sum_of_documents_length += int(self.doc_keys[docs][2])
-            ndocs += 1
-        self.avdl = sum_of_documents_length / ndocs
+    # the document lengths are read from the document keys and the average
+    # document length is calculated once for all the final index blocks
+    def calculate_collection_statistics(self) -> None:
+        self.doc_lengths = array('I', [0]) * (max(self.doc_keys, default=0)
+                                              + 1)
+        for doc_id in self.doc_keys:
+            self.doc_lengths[doc_id] = int(self.doc_keys[doc_id][2])
+        if len(self.doc_keys) == 0:
+            return
 
+        self.avdl = sum(self.doc_lengths) / len(self.doc_keys)
+        k = self.k
+        b = self.b
+        avdl = self.avdl
+        self.length_norms = array('d', [k * ((1 - b) + b * (dl / avdl))
+                                        for dl in self.doc_lengths])
+
+    def total_doc_length(self) -> int:
+        return sum(int(self.doc_keys[doc_id][2]) for doc_id in self.doc_keys)
+
+    # the weights of each posting list are calculated at once from the
+    # length normalizations of its documents
     def calculate_weights(self) -> None:
+        length_norms = self.length_norms
+        k1 = self.k + 1
         for term in self.inverted_index:
             idf = self.master_index[term][0]
-            for posting in self.inverted_index[term]:
-                tf = posting.weight
-                dl = int(self.doc_keys[posting.doc_id][2])
-                dividend = (self.k + 1) * tf
-                B = (1 - self.b) + self.b * (dl / self.avdl)
-                divider = (self.k * B) + tf
-                weight = dividend / divider
-                posting.weight = weight * idf
+            postings = self.inverted_index[term]
+            postings.weights = array('d', [
+                k1 * tf / (length_norms[doc_id] + tf) * idf
+                for doc_id, tf in zip(postings.doc_ids, postings.weights)])
 
     def posting_list_from_str(self,
-                              posting_str_list: str) -> List[PostingWeighted]:
+                              posting_str_list: str) -> PostingList:
         if self.use_positions:
-            posting_list = [PostingWeightedPositional.from_string(
-                posting_str) for posting_str in posting_str_list]
+            posting_list = PostingList.from_strings(
+                PostingWeightedPositional, posting_str_list)
         else:
-            posting_list = [PostingWeighted.from_string(
-                posting_str) for posting_str in posting_str_list]
+            posting_list = PostingList.from_strings(
+                PostingWeighted, posting_str_list)
         return posting_list
 
-    def update_dfs(self):
-        for term in self.master_index:
-            df = self.master_index[term][0]
-            idf = self.log(self.nr_indexed_docs) \
-                - self.log(df)
-            self.master_index[term][0] = idf
+    def posting_list_from_bytes(
+            self, posting_list_bytes: bytes) -> PostingList:
+        if self.use_positions:
+            return PostingList.from_bytes(PostingWeightedPositional,
+                                          posting_list_bytes)
+        else:
+            return PostingList.from_bytes(PostingWeighted,
+                                          posting_list_bytes)
+
+    def master_index_value(self, df: int) -> float:
+        return self.log(self.nr_indexed_docs) - self.log(df)
 
     def log(self, n: int) -> float:
         if n not in self.logarithm:
@@ -2,7 +2,7 @@ from typing import List, Dict
 from math import sqrt, log10
 
 from indexer import Indexer
-from postings import PostingWeighted, PostingWeightedPositional
+from postings import PostingList, PostingWeighted, PostingWeightedPositional
 from tokenizer import Tokenizer
 
 
@@ -11,12 +11,22 @@ class IndexerLncLtc(Indexer):
 
     def __init__(self, tokenizer: Tokenizer,
                  max_postings_per_temp_block: int = 1000000,
-                 use_positions=False) -> None:
+                 use_positions=False, workers: int = 1,
+                 index_format: str = 'tsv', memory_limit: float = 0,
+                 pipelined_reading: bool = False) -> None:
         super().__init__(tokenizer, max_postings_per_temp_block,
-                         use_positions=use_positions)
+                         use_positions=use_positions, workers=workers,
+                         index_format=index_format, memory_limit=memory_limit,
+                         pipelined_reading=pipelined_reading)
         self.logarithm = {}
         self.index_type = 'lnc.ltc'
 
+    def new_posting_list(self) -> PostingList:
+        if self.use_positions:
+            return PostingList(PostingWeightedPositional)
+        else:
+            return PostingList(PostingWeighted)
+
     def create_postings(self, doc_id: int, doc_body: str) -> None:
         tokens = self.tokenizer.tokenize_positional(doc_body)
         Wtds = {}
@@ -28,8 +38,7 @@ class IndexerLncLtc(Indexer):
         Wtdnorm = sqrt(Wtdnorm)
         for token in Wtds:
             normalized_Wtd = Wtds[token] / Wtdnorm
-            self.inverted_index[token].append(PostingWeighted(doc_id,
-                                              normalized_Wtd))
+            self.inverted_index[token].add(doc_id, normalized_Wtd)
             self.nr_postings += 1
             self.block_posting_count += 1
 
@@ -44,27 +53,36 @@ class IndexerLncLtc(Indexer):
         Wtdnorm = sqrt(Wtdnorm)
         for token in Wtds:
             normalized_Wtd = Wtds[token] / Wtdnorm
-            self.inverted_index[token].append(PostingWeightedPositional(doc_id,
-                                              normalized_Wtd, tokens[token]))
+            self.inverted_index[token].add(doc_id, normalized_Wtd,
+                                           tokens[token])
             self.nr_postings += 1
             self.block_posting_count += 1
+            self.block_position_count += len(tokens[token])
+
+    def final_indexing_calculations(self) -> None:
+        self.add_max_impacts_to_master_index()
 
     def posting_list_from_str(self,
-                              posting_str_list: str) -> List[PostingWeighted]:
+                              posting_str_list: str) -> PostingList:
         if self.use_positions:
-            posting_list = [PostingWeightedPositional.from_string(
-                posting_str) for posting_str in posting_str_list]
+            posting_list = PostingList.from_strings(
+                PostingWeightedPositional, posting_str_list)
         else:
-            posting_list = [PostingWeighted.from_string(
-                posting_str) for posting_str in posting_str_list]
+            posting_list = PostingList.from_strings(
+                PostingWeighted, posting_str_list)
         return posting_list
 
-    def update_dfs(self):
-        for term in self.master_index:
-            df = self.master_index[term][0]
-            idf = self.log(self.nr_indexed_docs) \
-                - self.log(df)
-            self.master_index[term][0] = idf
+    def posting_list_from_bytes(
+            self, posting_list_bytes: bytes) -> PostingList:
+        if self.use_positions:
+            return PostingList.from_bytes(PostingWeightedPositional,
+                                          posting_list_bytes)
+        else:
+            return PostingList.from_bytes(PostingWeighted,
+                                          posting_list_bytes)
+
+    def master_index_value(self, df: int) -> float:
+        return self.log(self.nr_indexed_docs) - self.log(df)
 
     def log(self, n):
         if n not in self.logarithm:
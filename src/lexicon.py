@@ -0,0 +1,134 @@
+from array import array
+from mmap import ACCESS_READ, mmap
+from os import replace
+from typing import Iterable, List, Optional, Sequence, Union
+
+# the lexicon of a binary index has the same rows as its master index, on a
+# single file that is memory mapped by the searcher instead of being read
+# into a dictionary. The file starts with the number of terms and the number
+# of values of each row, followed by arrays with one element per term: the
+# end offsets of the terms, the first value of each row (the document
+# frequency or IDF) as 8 byte floats, and the other values (the block
+# number and the byte offset and length of the postings, or the document
+# frequency on the master index of an incremental index) as 64 bit integers,
+# which are 0 when the rows don't have them. Rows of weighted indexes also
+# have the greatest weight of the postings of the term, which is stored as
+# an array of 8 byte floats only when there are such rows. The terms are
+# stored last, in the order of the master index, encoded in UTF-8. All
+# numbers are in the native byte order
+LEXICON_FILE_NAME = 'MasterIndex.bin'
+LEXICON_INTEGER_COLUMNS = 3
+
+
+def write_lexicon(file_path: str,
+                  rows: Iterable[Sequence[Union[str, float, int]]]) -> None:
+    term_bytes = bytearray()
+    term_end_offsets = array('Q')
+    values = array('d')
+    integer_columns = [array('Q') for _ in range(LEXICON_INTEGER_COLUMNS)]
+    max_impacts = array('d')
+    nr_values = 0
+
+    for row in rows:
+        term_bytes += row[0].encode('utf8')
+        term_end_offsets.append(len(term_bytes))
+        values.append(float(row[1]))
+        for column_nr, column in enumerate(integer_columns):
+            column.append(int(row[column_nr + 2])
+                          if column_nr + 2 < len(row) else 0)
+        max_impacts.append(float(row[LEXICON_INTEGER_COLUMNS + 2])
+                           if LEXICON_INTEGER_COLUMNS + 2 < len(row) else 0)
+        nr_values = max(nr_values, len(row) - 1)
+
+    with open(file_path + '.tmp', 'wb') as lexicon_file:
+        lexicon_file.write(array('Q', [len(values), nr_values]).tobytes())
+        lexicon_file.write(term_end_offsets.tobytes())
+        lexicon_file.write(values.tobytes())
+        for column in integer_columns:
+            lexicon_file.write(column.tobytes())
+        if nr_values > LEXICON_INTEGER_COLUMNS + 1:
+            lexicon_file.write(max_impacts.tobytes())
+        lexicon_file.write(term_bytes)
+
+    # the lexicon is replaced at once, as the master index of an incremental
+    # index may be read by a searcher while it's written
+    replace(file_path + '.tmp', file_path)
+
+
+# memory mapped lexicon, which is used like the dictionary of the master
+# index. Terms are found by a binary search over their UTF-8 bytes, which
+# have the same order as the terms themselves
+class Lexicon:
+    lexicon_map: mmap
+    nr_terms: int
+    nr_values: int
+    term_end_offsets: memoryview
+    values: memoryview
+    integer_columns: List[memoryview]
+    max_impacts: Optional[memoryview]
+    terms_offset: int
+
+    def __init__(self, file_path: str) -> None:
+        with open(file_path, 'rb') as lexicon_file:
+            self.lexicon_map = mmap(lexicon_file.fileno(), 0,
+                                    access=ACCESS_READ)
+        lexicon_view = memoryview(self.lexicon_map)
+        self.nr_terms, self.nr_values = lexicon_view[0:16].cast('Q')
+
+        offset = 16
+        array_size = 8 * self.nr_terms
+        self.term_end_offsets = \
+            lexicon_view[offset:offset + array_size].cast('Q')
+        offset += array_size
+        self.values = lexicon_view[offset:offset + array_size].cast('d')
+        offset += array_size
+        self.integer_columns = []
+        for _ in range(LEXICON_INTEGER_COLUMNS):
+            self.integer_columns.append(
+                lexicon_view[offset:offset + array_size].cast('Q'))
+            offset += array_size
+        self.max_impacts = None
+        if self.nr_values > LEXICON_INTEGER_COLUMNS + 1:
+            self.max_impacts = \
+                lexicon_view[offset:offset + array_size].cast('d')
+            offset += array_size
+        self.terms_offset = offset
+
+    def __len__(self) -> int:
+        return self.nr_terms
+
+    def __contains__(self, term: str) -> bool:
+        return self.find_term(term) >= 0
+
+    # the row of the term on the master index, without the term
+    def __getitem__(self, term: str) -> List[Union[float, int]]:
+        term_nr = self.find_term(term)
+        if term_nr < 0:
+            raise KeyError(term)
+        row = [self.values[term_nr]]
+        for column in self.integer_columns[:self.nr_values - 1]:
+            row.append(column[term_nr])
+        if self.max_impacts is not None:
+            row.append(self.max_impacts[term_nr])
+        return row
+
+    # number of the term on the lexicon, or -1 if it isn't there
+    def find_term(self, term: str) -> int:
+        term_bytes = term.encode('utf8')
+        term_end_offsets = self.term_end_offsets
+        terms_offset = self.terms_offset
+        low = 0
+        high = self.nr_terms
+        while low < high:
+            middle = (low + high) // 2
+            start = term_end_offsets[middle - 1] if middle > 0 else 0
+            middle_term = self.lexicon_map[terms_offset + start:
+                                           terms_offset
+                                           + term_end_offsets[middle]]
+            if middle_term < term_bytes:
+                low = middle + 1
+            elif middle_term > term_bytes:
+                high = middle
+            else:
+                return middle
+        return -1
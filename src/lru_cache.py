@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Union
+
+
+# least recently used cache, bounded by the number of entries, if given, and
+# by the estimated memory of the entries in bytes. The statistics are named
+# after the cache
+class LRUCache:
+    name: str
+    max_entries: Optional[int]
+    max_memory: int
+    entries: 'OrderedDict[Hashable, Any]'
+    entry_sizes: Dict[Hashable, int]
+    memory: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, name: str, max_memory: int,
+                 max_entries: Optional[int] = None) -> None:
+        self.name = name
+        self.max_memory = max_memory
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.entry_sizes = {}
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def is_enabled(self) -> bool:
+        return self.max_memory > 0 and (self.max_entries is None
+                                        or self.max_entries > 0)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.is_enabled():
+            return None
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    # entries that don't fit on the memory budget by themselves aren't kept
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        if not self.is_enabled() or size > self.max_memory:
+            return
+
+        self.remove(key)
+        while self.memory + size > self.max_memory or (
+                self.max_entries is not None
+                and len(self.entries) >= self.max_entries):
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+        self.entries[key] = value
+        self.entry_sizes[key] = size
+        self.memory += size
+
+    def remove(self, key: Hashable) -> None:
+        if key in self.entries:
+            del self.entries[key]
+            self.memory -= self.entry_sizes.pop(key)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.entry_sizes.clear()
+        self.memory = 0
+
+    def get_statistics(self) -> Dict[str, Union[int, float]]:
+        nr_lookups = self.hits + self.misses
+        return {
+            f'{self.name} hits': self.hits,
+            f'{self.name} misses': self.misses,
+            f'{self.name} hit rate': self.hits / nr_lookups
+            if nr_lookups > 0 else 0,
+            f'{self.name} evictions': self.evictions,
+            f'{self.name} entries': len(self.entries),
+            f'{self.name} memory (bytes)': self.memory
+        }
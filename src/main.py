@@ -1,11 +1,16 @@
 import sys
 from argparse import ArgumentParser
 from os import path
+from time import perf_counter
 
 from indexer import Indexer
 from indexer_bm25 import IndexerBM25
 from indexer_lnc_ltc import IndexerLncLtc
-from query import Query
+from posting_cache import POSTING_CACHE_MEMORY
+from proximity import DEFAULT_PROXIMITY_STRATEGY, PROXIMITY_STRATEGIES
+from query import RERANK_DEPTH, Query
+from result_cache import RESULT_CACHE_SIZE
+from server import SERVER_HOST, SERVER_PORT, run_server
 from tokenizer import Tokenizer
 
 
@@ -32,16 +37,32 @@ class Main:
         self.stemmer_enabled = True
         self.disable_positions = False
         self.max_post = 1000000
+        self.workers = 1
+        self.index_format = 'tsv'
+        self.memory_limit = 0
+        self.append_folder = ''
+        self.batch_stemming = False
+        self.pipelined_reading = False
 
         # searcher mode
         self.data = ''
         self.search_type = ''
         self.loop = False
+        self.evaluation = False
+        self.server = False
+        self.server_port = SERVER_PORT
         self.query_file = ''
         self.dump_results_file = False
         self.cmd_results = False
         self.disable_boost = False
         self.span_size = 4
+        self.proximity_strategy = DEFAULT_PROXIMITY_STRATEGY
+        self.rerank_depth = RERANK_DEPTH
+        self.top_k = 100
+        self.disable_pruning = False
+        self.result_cache_size = RESULT_CACHE_SIZE
+        self.posting_cache_memory = POSTING_CACHE_MEMORY
+        self.parallel = 1
 
         self.parser = ArgumentParser()
         self.tokenizer = Tokenizer(stopwords_path=self.stopwords_path,
@@ -89,14 +110,38 @@ class Main:
         parser.add_argument('--max_post',
                             help='Set the maximum postings per block',
                             type=int)
+        # number of processes used to tokenize the documents
+        parser.add_argument('--workers',
+                            help='Set the number of indexing processes',
+                            type=int, metavar='(integer number)')
+        # format of the index block files
+        parser.add_argument('--index_format',
+                            help='Set the format of the index blocks',
+                            type=str, metavar='tsv/binary')
+        # memory budget of the index blocks, overrides the maximum postings
+        parser.add_argument('--memory_limit',
+                            help='Set the memory limit of the index blocks in MB',
+                            type=float, metavar='(number of MB)')
+        # stem the new words of each document with a single stemmer call
+        parser.add_argument('--batch_stemming',
+                            help='Stem the new words of each document at once',
+                            action='store_true')
+        # decompress and parse the data file on a separate thread
+        parser.add_argument('--pipelined_reading',
+                            help='Read the data file on a separate thread',
+                            action='store_true')
+        # add the data file to an incremental index instead of rebuilding it
+        parser.add_argument('--append',
+                            help='Append the data to the incremental index on this folder',
+                            type=str, metavar='(index folder)')
 
         # IF IS QUERY MODE
         # set folder name
         parser.add_argument('--data', help="Folder that contains the index files for query mode",
                             type=str)
         # set the search mode
-        parser.add_argument('--search_type', help="Choose the search mode, 'file (file-path)' to use a file with a list of queries as input, 'loop' to insert queries in a loop through the terminal (empty query to end loop) or 'evaluation (file-path)' to use a file with a list of relevant queries as input",
-                            nargs='+', metavar='file (file-path) / loop / evaluation (file_path)')
+        parser.add_argument('--search_type', help="Choose the search mode, 'file (file-path)' to use a file with a list of queries as input, 'loop' to insert queries in a loop through the terminal (empty query to end loop), 'evaluation (file-path)' to use a file with a list of relevant queries as input or 'server (port)' to answer queries over a local socket",
+                            nargs='+', metavar='file (file-path) / loop / evaluation (file_path) / server (port)')
 
         parser.add_argument('--dump_file',
                             help='Enable to generate file with results',
@@ -114,6 +159,44 @@ class Main:
                             help='Set span size to booster',
                             type=int, metavar='(integer number)')
 
+        # how the proximity of the query terms is scored by the boost
+        parser.add_argument('--proximity',
+                            help='Set the proximity scoring of the boost',
+                            type=str, metavar='spans/window')
+
+        # number of the best documents that get the boost, 0 for all of them
+        parser.add_argument('--rerank_depth',
+                            help='Set the number of documents to boost',
+                            type=int, metavar='(integer number)')
+
+        # number of results of each query, of which 10 are shown
+        parser.add_argument('--top_k',
+                            help='Set the number of results of each query',
+                            type=int, metavar='(integer number)')
+
+        parser.add_argument('--disable_pruning',
+                            help='Score every document of the query terms',
+                            action='store_true')
+
+        # number of queries whose results are cached, 0 disables the cache
+        parser.add_argument('--result_cache',
+                            help='Set the number of cached query results',
+                            type=int, metavar='(integer number)')
+
+        # memory budget of the decoded posting lists kept across queries, 0
+        # disables the cache
+        parser.add_argument('--posting_cache',
+                            help='Set the memory budget of the cached posting '
+                                 'lists in MB',
+                            type=int, metavar='(number of MB)')
+
+        # number of processes that run the queries of the file and
+        # evaluation search types
+        parser.add_argument('--parallel',
+                            help='Set the number of processes that run the '
+                                 'queries of a file',
+                            type=int, metavar='(integer number)')
+
         # Set the query file
         #parser.add_argument('--query_file', help='Choose the path to search', type=str, metavar='(txt file)')
 
@@ -179,6 +262,30 @@ class Main:
             if args.max_post:
                 self.max_post = args.max_post
 
+            if args.workers:
+                self.workers = args.workers
+
+            if args.index_format:
+                if args.index_format == 'tsv' or args.index_format == 'binary':
+                    self.index_format = args.index_format
+                else:
+                    parser.error(
+                        '--index_format requires 2 options (tsv / binary).')
+                    sys.exit()
+
+            if args.memory_limit:
+                if args.memory_limit > 0:
+                    self.memory_limit = args.memory_limit
+                else:
+                    parser.error('--memory_limit must be a positive number.')
+                    sys.exit()
+
+            if args.append:
+                self.append_folder = args.append
+
+            self.batch_stemming = args.batch_stemming
+            self.pipelined_reading = args.pipelined_reading
+
         elif args.mode == 'searcher':
             # searcher
             self.mode = 'searcher'
@@ -200,6 +307,54 @@ class Main:
             if args.span_size:
                 self.span_size = args.span_size
 
+            if args.proximity:
+                if args.proximity in PROXIMITY_STRATEGIES:
+                    self.proximity_strategy = args.proximity
+                else:
+                    parser.error(
+                        '--proximity requires 2 options (spans / window).')
+                    sys.exit()
+
+            if args.rerank_depth is not None:
+                if args.rerank_depth > 0:
+                    self.rerank_depth = args.rerank_depth
+                elif args.rerank_depth == 0:
+                    self.rerank_depth = None
+                else:
+                    parser.error('--rerank_depth must not be negative.')
+                    sys.exit()
+
+            if args.top_k:
+                if args.top_k > 0:
+                    self.top_k = args.top_k
+                else:
+                    parser.error('--top_k must be a positive number.')
+                    sys.exit()
+
+            self.disable_pruning = args.disable_pruning
+
+            if args.result_cache is not None:
+                if args.result_cache >= 0:
+                    self.result_cache_size = args.result_cache
+                else:
+                    parser.error('--result_cache must not be negative.')
+                    sys.exit()
+
+            if args.posting_cache is not None:
+                if args.posting_cache >= 0:
+                    self.posting_cache_memory = \
+                        args.posting_cache * 1024 * 1024
+                else:
+                    parser.error('--posting_cache must not be negative.')
+                    sys.exit()
+
+            if args.parallel:
+                if args.parallel > 0:
+                    self.parallel = args.parallel
+                else:
+                    parser.error('--parallel must be a positive number.')
+                    sys.exit()
+
             # search_type
             if args.search_type:
                 if args.search_type[0] == 'loop':
@@ -223,16 +378,26 @@ class Main:
                     if not path.exists(self.query_file):
                         print('Queries Relevant file does not exist!')
                         sys.exit()
+                elif args.search_type[0] == 'server':
+                    self.server = True
+                    if len(args.search_type) > 1:
+                        if not args.search_type[1].isdigit():
+                            parser.error(
+                                'Type of search "server" requires a port number')
+                            sys.exit()
+                        self.server_port = int(args.search_type[1])
                 else:
                     parser.error(
-                        'Search type requires one of three options: file / loop / evaluation.')
+                        'Search type requires one of four options: file / loop / evaluation / server.')
                     sys.exit()
             else:
                 parser.error(
-                    'Search type requires one of three options: file / loop / evaluation.')
+                    'Search type requires one of four options: file / loop / evaluation / server.')
                 sys.exit()
 
-            if not args.dump_file and not args.cmd_results:
+            # the server answers the queries over its socket
+            if not args.dump_file and not args.cmd_results \
+                    and not self.server:
                 parser.error(
                     'Search type requires at least one of two options: --dump_file / --cmd_results')
                 sys.exit()
@@ -259,29 +424,58 @@ class Main:
             if self.index_type == 'bm25':
                 tokenizer = Tokenizer(stopwords_path=self.stopwords_path,
                                       stemmer_enabled=self.stemmer_enabled,
-                                      size_filter=self.minimum_word_size)
+                                      size_filter=self.minimum_word_size,
+                                      batch_stemming=self.batch_stemming)
                 indexer = IndexerBM25(
-                    tokenizer,  use_positions= not self.disable_positions)
-                indexer.index_data_source(self.data_path)
+                    tokenizer,  use_positions= not self.disable_positions,
+                    max_postings_per_temp_block=self.max_post,
+                    workers=self.workers, index_format=self.index_format,
+                    memory_limit=self.memory_limit,
+                    pipelined_reading=self.pipelined_reading)
+                if self.append_folder:
+                    indexer.append_data_source(self.data_path,
+                                               self.append_folder)
+                else:
+                    indexer.index_data_source(self.data_path)
                 statistics = indexer.get_statistics()
                 for statistic in statistics:
                     print(f'{statistic}: {statistics[statistic]}')
+                indexer.wait_for_merges()
             elif self.index_type == 'lnc.ltc':
                 tokenizer = Tokenizer(stopwords_path=self.stopwords_path,
                                       stemmer_enabled=self.stemmer_enabled,
-                                      size_filter=self.minimum_word_size)
+                                      size_filter=self.minimum_word_size,
+                                      batch_stemming=self.batch_stemming)
                 indexer = IndexerLncLtc(
-                    tokenizer,  use_positions= not self.disable_positions)
-                indexer.index_data_source(self.data_path)
+                    tokenizer,  use_positions= not self.disable_positions,
+                    max_postings_per_temp_block=self.max_post,
+                    workers=self.workers, index_format=self.index_format,
+                    memory_limit=self.memory_limit,
+                    pipelined_reading=self.pipelined_reading)
+                if self.append_folder:
+                    indexer.append_data_source(self.data_path,
+                                               self.append_folder)
+                else:
+                    indexer.index_data_source(self.data_path)
                 statistics = indexer.get_statistics()
                 for statistic in statistics:
                     print(f'{statistic}: {statistics[statistic]}')
+                indexer.wait_for_merges()
 
         elif self.mode == 'searcher':
             query = Query(
                 data_path=self.data, dump_results_file=self.dump_results_file, cmd_results=self.cmd_results, 
-                positional_boost_enabled = not self.disable_boost, span_size = self.span_size)
-            if self.loop:
+                positional_boost_enabled = not self.disable_boost, span_size = self.span_size,
+                top_k=self.top_k, dynamic_pruning=not self.disable_pruning,
+                result_cache_size=self.result_cache_size,
+                posting_cache_memory=self.posting_cache_memory,
+                workers=1 if self.server else self.parallel,
+                proximity_strategy=self.proximity_strategy,
+                rerank_depth=self.rerank_depth)
+            if self.server:
+                print('Serving on {}:{}'.format(SERVER_HOST, self.server_port))
+                run_server(query, SERVER_HOST, self.server_port)
+            elif self.loop:
                 print('Words to search:')
                 to_search = input()
                 while (to_search != ''):
@@ -290,6 +484,7 @@ class Main:
                     if self.cmd_results:
                         print()
                         self.show_results(to_search, query_result)
+                        self.show_postings_statistics(query)
                         print('Time used: {:0.3f}s \n'.format(total_time))
 
                     print('Words to search:')
@@ -301,28 +496,46 @@ class Main:
                 if self.dump_results_file:
                     query.dump_evaluation_result(evaluation)
             else:
+                # the queries of the file are processed in batches that read
+                # each final index block once
                 lines = self.read_query_file()
-                for line in lines:
-                    query_result, total_time = query.process_query(line)
+                start_time = perf_counter()
+                for line, (query_result, total_time) in zip(
+                        lines, query.process_queries(lines)):
                     if self.cmd_results:
                         print()
                         self.show_results(line.replace("\n", ""), query_result)
+                        self.show_postings_statistics(query)
                         print('Time used: {:0.3f}s \n'.format(total_time))
+                if self.cmd_results:
+                    print('Total time used: {:0.3f}s'.format(
+                        perf_counter() - start_time))
+
+            if self.cmd_results:
+                statistics = query.get_statistics()
+                for statistic in statistics:
+                    print(f'{statistic}: {statistics[statistic]}')
 
 
     def show_results(self, query, results):
-        i = 0
         print('Q: {}'.format(query))
         if len(results) == 0:
             print('Nothing found!')
         else:
-            for result in results:
-                if i < 10:
-                    res = tuple(result)
-                    print(res[0] + " -> " + res[1])
-                i += 1
+            for result in results[:10]:
+                res = tuple(result)
+                print(res[0] + " -> " + res[1])
         print()
 
+    def show_postings_statistics(self, query):
+        print('Postings scored: {}'.format(query.nr_scored_postings))
+        print('Postings skipped: {}'.format(query.nr_skipped_postings))
+        statistics = query.posting_cache.get_statistics()
+        print('Posting cache hits: {} ({:0.1%}), memory: {:0.1f} MB'.format(
+            statistics['Posting cache hits'],
+            statistics['Posting cache hit rate'],
+            statistics['Posting cache memory (bytes)'] / 1024 / 1024))
+
 
 if __name__ == '__main__':
 
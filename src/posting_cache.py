@@ -0,0 +1,35 @@
+from sys import getsizeof
+from typing import Dict, Hashable
+
+from lru_cache import LRUCache
+from postings import PositionalPostings
+
+# default memory budget of the decoded posting lists kept by the searcher, in
+# bytes
+POSTING_CACHE_MEMORY = 128 * 1024 * 1024
+
+
+# estimated bytes of memory used by a decoded posting list, a dictionary with
+# the weight of each posting by document ID. The postings of positional
+# indexes also have the positions, which are only decoded when they are read
+def estimate_postings_size(postings: Dict[int, tuple]) -> int:
+    size = getsizeof(postings)
+    if len(postings) == 0:
+        return size
+    fields = next(iter(postings.values()))
+    size += len(postings) * (getsizeof(0) + getsizeof(fields)
+                             + getsizeof(0.0))
+    if isinstance(postings, PositionalPostings):
+        size += getsizeof(postings.positions)
+    return size
+
+
+# least recently used cache of the decoded posting lists of the searcher, by
+# final index block file and term, bounded by their memory
+class PostingListCache(LRUCache):
+
+    def __init__(self, max_memory: int = POSTING_CACHE_MEMORY) -> None:
+        super().__init__('Posting cache', max_memory)
+
+    def put(self, key: Hashable, postings: Dict[int, tuple]) -> None:
+        super().put(key, postings, estimate_postings_size(postings))
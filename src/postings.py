@@ -1,9 +1,206 @@
-from typing import List
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from sys import byteorder, getsizeof, maxsize
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# number of consecutive integers that share the same byte width in the binary
+# format
+PACKING_CHUNK_SIZE = 128
+
+# array type codes for each byte width of the packed integers
+PACKING_TYPE_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+# number of postings of each skip block of the binary posting lists
+SKIP_INTERVAL = PACKING_CHUNK_SIZE
+
+# document ID of a posting cursor past the end of its posting list, which is
+# greater than any document ID
+END_OF_POSTINGS = maxsize
+
+
+def encode_varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+# the integers are split into chunks, and each chunk is stored little endian
+# with the smallest byte width that fits its largest value, preceded by that
+# width. Small gaps take a single byte, while decoding each chunk is a single
+# array conversion instead of a loop over variable length bytes
+def encode_integers(values: Sequence[int]) -> bytes:
+    encoded = bytearray()
+    for start in range(0, len(values), PACKING_CHUNK_SIZE):
+        chunk = values[start:start + PACKING_CHUNK_SIZE]
+        largest_value = max(chunk)
+        for width in PACKING_TYPE_CODES:
+            if largest_value < 1 << (8 * width):
+                break
+        packed = array(PACKING_TYPE_CODES[width], chunk)
+        if byteorder == 'big':
+            packed.byteswap()
+        encoded.append(width)
+        encoded += packed.tobytes()
+    return bytes(encoded)
+
+
+def decode_integers(data: bytes, offset: int,
+                    count: int) -> Tuple[List[int], int]:
+    values = []
+    while count > 0:
+        chunk_size = min(count, PACKING_CHUNK_SIZE)
+        width = data[offset]
+        end = offset + 1 + chunk_size * width
+        packed = array(PACKING_TYPE_CODES[width])
+        packed.frombytes(data[offset + 1:end])
+        if byteorder == 'big':
+            packed.byteswap()
+        values.extend(packed)
+        offset = end
+        count -= chunk_size
+    return values, offset
+
+
+# document IDs are stored as the gaps between consecutive IDs, the first one
+# being the gap to the document ID before the list
+def encode_doc_ids(doc_ids: Sequence[int], previous_doc_id: int = 0) -> bytes:
+    gaps = [doc_ids[0] - previous_doc_id] \
+        + [doc_ids[i] - doc_ids[i - 1] for i in range(1, len(doc_ids))]
+    return encode_integers(gaps)
+
+
+def decode_doc_ids(data: bytes, offset: int, count: int,
+                   previous_doc_id: int = 0) -> Tuple[List[int], int]:
+    gaps, offset = decode_integers(data, offset, count)
+    if previous_doc_id > 0 and count > 0:
+        gaps[0] += previous_doc_id
+    return list(accumulate(gaps)), offset
+
+
+def count_skip_blocks(count: int) -> int:
+    return (count + SKIP_INTERVAL - 1) // SKIP_INTERVAL
+
+
+# the skip pointers of a posting list are the last document ID of each skip
+# block, stored as gaps, followed by the length in bytes of each block
+def encode_skip_pointers(last_doc_ids: List[int],
+                         block_lengths: List[int]) -> bytes:
+    return encode_doc_ids(last_doc_ids) + encode_integers(block_lengths)
+
+
+# returns the last document ID and the start offset of each skip block, and
+# the offset where the skip pointers end, which is where the first block
+# starts
+def decode_skip_pointers(data: bytes, offset: int, nr_blocks: int
+                         ) -> Tuple[List[int], List[int], int]:
+    last_doc_ids, offset = decode_doc_ids(data, offset, nr_blocks)
+    block_lengths, offset = decode_integers(data, offset, nr_blocks)
+    block_offsets = list(accumulate([offset] + block_lengths[:-1]))
+    return last_doc_ids, block_offsets, offset
+
+
+def encode_weights(weights: List[float]) -> bytes:
+    packed = array('d', weights)
+    if byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def decode_weights(data: bytes, offset: int,
+                   count: int) -> Tuple[List[float], int]:
+    end = offset + count * 8
+    packed = array('d')
+    packed.frombytes(data[offset:end])
+    if byteorder == 'big':
+        packed.byteswap()
+    return packed.tolist(), end
+
+
+# the number of positions of each posting is stored first, followed by the
+# gaps between consecutive positions of all postings
+def encode_positions(positions_list: List[List[int]]) -> bytes:
+    counts = [len(positions) for positions in positions_list]
+    gaps = []
+    for positions in positions_list:
+        gaps.append(positions[0])
+        gaps.extend(positions[i] - positions[i - 1]
+                    for i in range(1, len(positions)))
+    return encode_integers(counts) + encode_integers(gaps)
+
+
+def decode_positions(data: bytes, offset: int,
+                     count: int) -> Tuple[List[List[int]], int]:
+    counts, offset = decode_integers(data, offset, count)
+    gaps, offset = decode_integers(data, offset, sum(counts))
+    positions_list = []
+    start = 0
+    for positions_count in counts:
+        end = start + positions_count
+        positions_list.append(list(accumulate(gaps[start:end])))
+        start = end
+    return positions_list, offset
+
+
+# the positions of a positional posting list are stored after its skip
+# blocks, so that the other fields are decoded without them. They are split
+# into position blocks with the positions of the postings of each skip
+# block, preceded by the length in bytes of each position block when there
+# is more than one
+def encode_position_blocks(positions_list: List[List[int]]) -> bytes:
+    blocks = [encode_positions(positions_list[start:start + SKIP_INTERVAL])
+              for start in range(0, len(positions_list), SKIP_INTERVAL)]
+    encoded = b''
+    if len(blocks) > 1:
+        encoded = encode_integers([len(block) for block in blocks])
+    return encoded + b''.join(blocks)
+
+
+# returns the start offset of each position block, and the offset where the
+# first one starts
+def decode_position_block_offsets(data: bytes, offset: int,
+                                  count: int) -> Tuple[List[int], int]:
+    nr_blocks = count_skip_blocks(count)
+    if nr_blocks <= 1:
+        return [offset] * nr_blocks, offset
+    block_lengths, offset = decode_integers(data, offset, nr_blocks)
+    return list(accumulate([offset] + block_lengths[:-1])), offset
+
+
+def decode_position_blocks(data: bytes, offset: int,
+                           count: int) -> Tuple[List[List[int]], int]:
+    _, offset = decode_position_block_offsets(data, offset, count)
+    positions_list = []
+    for start in range(0, count, SKIP_INTERVAL):
+        block_positions_list, offset = decode_positions(
+            data, offset, min(SKIP_INTERVAL, count - start))
+        positions_list.extend(block_positions_list)
+    return positions_list, offset
 
 
 class Posting:
+    __slots__ = ('doc_id',)
     doc_id: int
 
+    # the fields stored by each posting type
+    is_weighted = False
+    is_positional = False
+
     def __init__(self, doc_id: int) -> None:
         self.doc_id = doc_id
 
@@ -14,10 +211,103 @@ class Posting:
     def to_string(self) -> str:
         return str(self.doc_id)
 
+    # the values of the fields, in the order of the arguments of the
+    # constructor
+    def fields(self) -> tuple:
+        return (self.doc_id,)
+
+    # the binary format stores a whole posting list at once, starting with
+    # the number of postings. The postings are split into skip blocks of
+    # SKIP_INTERVAL postings, and lists with more than one block have skip
+    # pointers after the number of postings, so that a cursor can jump to
+    # the block of a document without decoding the blocks before it. Each
+    # block has the fields of its postings stored contiguously, starting
+    # with the document IDs, except for the positions, which are stored
+    # after the last block. The columns are the lists of values of each
+    # field, in the order of the arguments of the constructor
+    @classmethod
+    def columns_to_bytes(cls, columns: List[Sequence]) -> bytes:
+        count = len(columns[0])
+        blocks = []
+        last_doc_ids = []
+        previous_doc_id = 0
+        for start in range(0, count, SKIP_INTERVAL):
+            block_columns = [column[start:start + SKIP_INTERVAL]
+                             for column in columns]
+            blocks.append(cls.block_to_bytes(block_columns, previous_doc_id))
+            previous_doc_id = block_columns[0][-1]
+            last_doc_ids.append(previous_doc_id)
+
+        encoded = encode_varint(count)
+        if len(blocks) > 1:
+            encoded += encode_skip_pointers(
+                last_doc_ids, [len(block) for block in blocks])
+        encoded += b''.join(blocks)
+        if cls.is_positional:
+            encoded += encode_position_blocks(columns[-1])
+        return encoded
+
+    # returns the columns and the offset where the posting list ends. The
+    # positions are left out when positions is False, and the offset is
+    # then where they start
+    @classmethod
+    def columns_from_bytes(cls, data: bytes, offset: int = 0,
+                           positions: bool = True
+                           ) -> Tuple[List[list], int]:
+        count, offset = decode_varint(data, offset)
+        nr_blocks = count_skip_blocks(count)
+        if nr_blocks > 1:
+            _, _, offset = decode_skip_pointers(data, offset, nr_blocks)
+
+        columns = []
+        previous_doc_id = 0
+        for start in range(0, count, SKIP_INTERVAL):
+            block_columns, offset = cls.block_from_bytes(
+                data, offset, min(SKIP_INTERVAL, count - start),
+                previous_doc_id)
+            previous_doc_id = block_columns[0][-1]
+            if len(columns) == 0:
+                columns = block_columns
+            else:
+                for column, block_column in zip(columns, block_columns):
+                    column.extend(block_column)
+
+        if cls.is_positional and positions:
+            positions_list, offset = decode_position_blocks(data, offset,
+                                                            count)
+            columns.append(positions_list)
+        return columns, offset
+
+    # the fields of the postings of a skip block besides their positions
+    @classmethod
+    def block_to_bytes(cls, columns: List[Sequence],
+                       previous_doc_id: int) -> bytes:
+        return encode_doc_ids(columns[0], previous_doc_id)
+
+    @classmethod
+    def block_from_bytes(cls, data: bytes, offset: int, count: int,
+                         previous_doc_id: int) -> Tuple[List[list], int]:
+        doc_ids, offset = decode_doc_ids(data, offset, count, previous_doc_id)
+        return [doc_ids], offset
+
+    @classmethod
+    def list_to_bytes(cls, postings: List['Posting']) -> bytes:
+        columns = [list(column) for column in zip(*[
+            posting.fields() for posting in postings])]
+        return cls.columns_to_bytes(columns)
+
+    @classmethod
+    def list_from_bytes(cls, data: bytes) -> List['Posting']:
+        columns, _ = cls.columns_from_bytes(data)
+        return [cls(*fields) for fields in zip(*columns)]
+
 
 class PostingPositional(Posting):
+    __slots__ = ('positions',)
     positions: List[int]
 
+    is_positional = True
+
     def __init__(self, doc_id: int, positions: List[int]) -> None:
         super().__init__(doc_id)
         self.positions = positions
@@ -32,10 +322,16 @@ class PostingPositional(Posting):
         positions_str = (','.join([str(i) for i in self.positions]))
         return super().to_string() + ':' + positions_str
 
+    def fields(self) -> tuple:
+        return (self.doc_id, self.positions)
+
 
 class PostingWeighted(Posting):
+    __slots__ = ('weight',)
     weight: float
 
+    is_weighted = True
+
     def __init__(self, doc_id: int, weight: float) -> None:
         super().__init__(doc_id)
         self.weight = weight
@@ -48,10 +344,30 @@ class PostingWeighted(Posting):
     def to_string(self) -> str:
         return super().to_string() + ':' + str(self.weight)
 
+    def fields(self) -> tuple:
+        return (self.doc_id, self.weight)
+
+    @classmethod
+    def block_to_bytes(cls, columns: List[Sequence],
+                       previous_doc_id: int) -> bytes:
+        return super().block_to_bytes(columns, previous_doc_id) \
+            + encode_weights(columns[1])
+
+    @classmethod
+    def block_from_bytes(cls, data: bytes, offset: int, count: int,
+                         previous_doc_id: int) -> Tuple[List[list], int]:
+        columns, offset = super().block_from_bytes(data, offset, count,
+                                                   previous_doc_id)
+        weights, offset = decode_weights(data, offset, count)
+        return columns + [weights], offset
+
 
 class PostingWeightedPositional(PostingWeighted):
+    __slots__ = ('positions',)
     positions: List[int]
 
+    is_positional = True
+
     def __init__(self, doc_id: int, weight: float,
                  positions: List[int]) -> None:
         super().__init__(doc_id, weight)
@@ -66,3 +382,385 @@ class PostingWeightedPositional(PostingWeighted):
     def to_string(self) -> str:
         positions_str = (','.join([str(i) for i in self.positions]))
         return super().to_string() + ':' + positions_str
+
+    def fields(self) -> tuple:
+        return (self.doc_id, self.weight, self.positions)
+
+
+# compact posting list used by the indexers for the index blocks in memory.
+# Instead of a posting object per document, the fields of all postings are
+# kept in typed arrays: the document IDs, the weights and the positions of
+# all postings one after the other, with the number of positions of each
+# posting. The postings are written to disk exactly as the posting objects of
+# posting_class would be
+class PostingList:
+    __slots__ = ('posting_class', 'doc_ids', 'weights', 'positions',
+                 'position_counts')
+    posting_class: type
+    doc_ids: array
+    weights: array
+    positions: array
+    position_counts: array
+
+    # weights are stored as doubles, or as integers for term frequencies, so
+    # that they are written in the same way as a Python float or int
+    def __init__(self, posting_class: type,
+                 weight_type_code: str = 'd') -> None:
+        self.posting_class = posting_class
+        self.doc_ids = array('I')
+        if posting_class.is_weighted:
+            self.weights = array(weight_type_code)
+        if posting_class.is_positional:
+            self.positions = array('I')
+            self.position_counts = array('I')
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # estimated bytes of memory used by a posting list without any postings,
+    # and by each posting besides its positions
+    def memory_sizes(self) -> Tuple[int, int]:
+        arrays = [self.doc_ids]
+        if self.posting_class.is_weighted:
+            arrays.append(self.weights)
+        if self.posting_class.is_positional:
+            arrays.extend([self.positions, self.position_counts])
+        empty_size = getsizeof(self) + sum(getsizeof(posting_array)
+                                           for posting_array in arrays)
+        posting_size = self.doc_ids.itemsize
+        if self.posting_class.is_weighted:
+            posting_size += self.weights.itemsize
+        if self.posting_class.is_positional:
+            posting_size += self.position_counts.itemsize
+        return empty_size, posting_size
+
+    def __iter__(self) -> Iterator[Posting]:
+        return (self.posting_class(*fields) for fields in zip(*self.columns()))
+
+    def add(self, doc_id: int, weight: float = 0,
+            positions: List[int] = None) -> None:
+        self.doc_ids.append(doc_id)
+        if self.posting_class.is_weighted:
+            self.weights.append(weight)
+        if self.posting_class.is_positional:
+            self.positions.extend(positions)
+            self.position_counts.append(len(positions))
+
+    def append(self, posting: Posting) -> None:
+        self.add(posting.doc_id, getattr(posting, 'weight', 0),
+                 getattr(posting, 'positions', None))
+
+    # the postings of the other list must have greater document IDs
+    def extend(self, posting_list: 'PostingList') -> None:
+        self.doc_ids.extend(posting_list.doc_ids)
+        if self.posting_class.is_weighted:
+            self.weights.extend(posting_list.weights)
+        if self.posting_class.is_positional:
+            self.positions.extend(posting_list.positions)
+            self.position_counts.extend(posting_list.position_counts)
+
+    def positions_list(self) -> List[array]:
+        positions_list = []
+        start = 0
+        for positions_count in self.position_counts:
+            positions_list.append(self.positions[start:start
+                                                 + positions_count])
+            start += positions_count
+        return positions_list
+
+    def columns(self) -> List[Sequence]:
+        columns = [self.doc_ids]
+        if self.posting_class.is_weighted:
+            columns.append(self.weights)
+        if self.posting_class.is_positional:
+            columns.append(self.positions_list())
+        return columns
+
+    # same strings as the to_string method of each posting
+    def to_strings(self) -> List[str]:
+        fields_str = [[str(doc_id) for doc_id in self.doc_ids]]
+        if self.posting_class.is_weighted:
+            fields_str.append([str(weight) for weight in self.weights])
+        if self.posting_class.is_positional:
+            fields_str.append([','.join(map(str, positions))
+                               for positions in self.positions_list()])
+        return [':'.join(posting_fields) for posting_fields in zip(*fields_str)]
+
+    def to_bytes(self) -> bytes:
+        return self.posting_class.columns_to_bytes(self.columns())
+
+    @classmethod
+    def from_strings(cls, posting_class: type,
+                     posting_str_list: List[str]) -> 'PostingList':
+        posting_list = cls(posting_class)
+        for posting_str in posting_str_list:
+            posting_list.append(posting_class.from_string(posting_str))
+        return posting_list
+
+    @classmethod
+    def from_bytes(cls, posting_class: type, data: bytes) -> 'PostingList':
+        posting_list = cls(posting_class)
+        columns, _ = posting_class.columns_from_bytes(data)
+        posting_list.doc_ids.extend(columns[0])
+        if posting_class.is_weighted:
+            posting_list.weights.extend(columns[1])
+        if posting_class.is_positional:
+            for positions in columns[-1]:
+                posting_list.positions.extend(positions)
+                posting_list.position_counts.append(len(positions))
+        return posting_list
+
+
+# cursor over the postings of a binary posting list, for document-at-a-time
+# search. The cursor starts before the first posting, and only decodes the
+# document IDs of the skip blocks it gets to, using the skip pointers to
+# jump over the others, and the other fields of a block only when they are
+# read, besides the positions. Once past the last posting its document ID is
+# END_OF_POSTINGS
+class PostingCursor:
+    __slots__ = ('posting_class', 'data', 'count', 'last_doc_ids',
+                 'block_offsets', 'block_nr', 'block_doc_ids',
+                 'block_fields', 'position_block_offsets', 'block_positions',
+                 'index', 'doc_id')
+    posting_class: type
+    data: bytes
+    count: int
+    last_doc_ids: List[int]
+    block_offsets: List[int]
+    block_nr: int
+    block_doc_ids: List[int]
+    block_fields: List[tuple]
+    position_block_offsets: List[int]
+    block_positions: List[List[int]]
+    index: int
+    doc_id: int
+
+    def __init__(self, posting_class: type, data: bytes) -> None:
+        self.posting_class = posting_class
+        self.data = data
+        self.count, offset = decode_varint(data, 0)
+        nr_blocks = count_skip_blocks(self.count)
+        if nr_blocks > 1:
+            self.last_doc_ids, self.block_offsets, _ = \
+                decode_skip_pointers(data, offset, nr_blocks)
+        else:
+            # the last document ID of a list without skip pointers is only
+            # known once its block is decoded
+            self.last_doc_ids = [END_OF_POSTINGS] * nr_blocks
+            self.block_offsets = [offset] * nr_blocks
+        self.block_nr = -1
+        self.block_doc_ids = []
+        self.block_fields = []
+        self.position_block_offsets = []
+        self.block_positions = []
+        self.index = -1
+        self.doc_id = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    # moves to the next posting and returns its document ID
+    def next(self) -> int:
+        index = self.index + 1
+        if index < len(self.block_doc_ids):
+            self.index = index
+            self.doc_id = self.block_doc_ids[index]
+        elif self.block_nr + 1 < len(self.block_offsets):
+            self.read_block(self.block_nr + 1)
+            self.index = 0
+            self.doc_id = self.block_doc_ids[0]
+        else:
+            self.finish()
+        return self.doc_id
+
+    # moves to the first posting with a document ID greater or equal to the
+    # target, if the cursor isn't already there, and returns its document ID
+    def advance(self, target_doc_id: int) -> int:
+        if self.doc_id >= target_doc_id:
+            return self.doc_id
+
+        block_nr = max(self.block_nr, 0)
+        if self.last_doc_ids[block_nr] < target_doc_id:
+            block_nr = bisect_left(self.last_doc_ids, target_doc_id,
+                                   block_nr + 1)
+            if block_nr == len(self.last_doc_ids):
+                self.finish()
+                return self.doc_id
+        if block_nr != self.block_nr:
+            self.read_block(block_nr)
+            self.index = -1
+
+        index = bisect_left(self.block_doc_ids, target_doc_id, self.index + 1)
+        if index < len(self.block_doc_ids):
+            self.index = index
+            self.doc_id = self.block_doc_ids[index]
+        else:
+            self.finish()
+        return self.doc_id
+
+    # the values of the fields of the posting besides the document ID and
+    # the positions, in the order of the arguments of the constructor of the
+    # posting class
+    def fields(self) -> tuple:
+        if len(self.block_fields) == 0:
+            columns, _ = self.posting_class.block_from_bytes(
+                self.data, self.block_offsets[self.block_nr],
+                len(self.block_doc_ids), self.previous_doc_id())
+            self.block_fields = list(zip(*columns[1:])) if len(columns) > 1 \
+                else [()] * len(self.block_doc_ids)
+        return self.block_fields[self.index]
+
+    # the positions of the posting, of a positional posting list. The
+    # position blocks are found the first time that positions are read,
+    # from the end of the last skip block
+    def positions(self) -> List[int]:
+        if len(self.position_block_offsets) == 0:
+            last_block_nr = len(self.block_offsets) - 1
+            previous_doc_id = self.last_doc_ids[last_block_nr - 1] \
+                if last_block_nr > 0 else 0
+            _, positions_offset = self.posting_class.block_from_bytes(
+                self.data, self.block_offsets[last_block_nr],
+                self.count - last_block_nr * SKIP_INTERVAL, previous_doc_id)
+            self.position_block_offsets, _ = decode_position_block_offsets(
+                self.data, positions_offset, self.count)
+        if len(self.block_positions) == 0:
+            self.block_positions, _ = decode_positions(
+                self.data, self.position_block_offsets[self.block_nr],
+                len(self.block_doc_ids))
+        return self.block_positions[self.index]
+
+    def read_block(self, block_nr: int) -> None:
+        self.block_nr = block_nr
+        self.block_doc_ids, _ = decode_doc_ids(
+            self.data, self.block_offsets[block_nr],
+            min(SKIP_INTERVAL, self.count - block_nr * SKIP_INTERVAL),
+            self.previous_doc_id())
+        self.block_fields = []
+        self.block_positions = []
+
+    def previous_doc_id(self) -> int:
+        return self.last_doc_ids[self.block_nr - 1] if self.block_nr > 0 \
+            else 0
+
+    def finish(self) -> None:
+        self.block_nr = len(self.block_offsets)
+        self.block_doc_ids = []
+        self.block_fields = []
+        self.block_positions = []
+        self.index = -1
+        self.doc_id = END_OF_POSTINGS
+
+
+# cursor with the same methods over a posting list that is already decoded,
+# given by the document IDs of its postings in ascending order, the values
+# of the other fields of each posting and, for positional posting lists,
+# the positions of the postings by document ID
+class DecodedPostingCursor:
+    __slots__ = ('doc_ids', 'fields_list', 'positions_by_doc_id', 'index',
+                 'doc_id')
+    doc_ids: List[int]
+    fields_list: List[tuple]
+    positions_by_doc_id: Optional[Union['PostingPositions',
+                                        'PostingPositionStrings']]
+    index: int
+    doc_id: int
+
+    def __init__(self, doc_ids: List[int], fields_list: List[tuple],
+                 positions_by_doc_id: Optional[Union[
+                     'PostingPositions', 'PostingPositionStrings']] = None
+                 ) -> None:
+        self.doc_ids = doc_ids
+        self.fields_list = fields_list
+        self.positions_by_doc_id = positions_by_doc_id
+        self.index = -1
+        self.doc_id = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def next(self) -> int:
+        self.index += 1
+        self.doc_id = self.doc_ids[self.index] \
+            if self.index < len(self.doc_ids) else END_OF_POSTINGS
+        return self.doc_id
+
+    def advance(self, target_doc_id: int) -> int:
+        if self.doc_id < target_doc_id:
+            self.index = bisect_left(self.doc_ids, target_doc_id,
+                                     self.index + 1)
+            self.doc_id = self.doc_ids[self.index] \
+                if self.index < len(self.doc_ids) else END_OF_POSTINGS
+        return self.doc_id
+
+    def fields(self) -> tuple:
+        return self.fields_list[self.index]
+
+    def positions(self) -> List[int]:
+        return self.positions_by_doc_id[self.doc_id]
+
+
+# positions of the postings of a binary posting list, by document ID, given
+# the document IDs of the postings and the offset where their positions
+# start. Each position block is only decoded when the positions of one of
+# its postings are read
+class PostingPositions:
+    __slots__ = ('data', 'doc_ids', 'block_offsets', 'blocks')
+    data: bytes
+    doc_ids: List[int]
+    block_offsets: List[int]
+    blocks: Dict[int, List[List[int]]]
+
+    def __init__(self, data: bytes, offset: int, doc_ids: List[int]) -> None:
+        self.data = data
+        self.doc_ids = doc_ids
+        self.block_offsets, _ = decode_position_block_offsets(
+            data, offset, len(doc_ids))
+        self.blocks = {}
+
+    def __getitem__(self, doc_id: int) -> List[int]:
+        index = bisect_left(self.doc_ids, doc_id)
+        if index == len(self.doc_ids) or self.doc_ids[index] != doc_id:
+            raise KeyError(doc_id)
+        block_nr = index // SKIP_INTERVAL
+        if block_nr not in self.blocks:
+            self.blocks[block_nr], _ = decode_positions(
+                self.data, self.block_offsets[block_nr],
+                min(SKIP_INTERVAL, len(self.doc_ids) - block_nr
+                    * SKIP_INTERVAL))
+        return self.blocks[block_nr][index % SKIP_INTERVAL]
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + getsizeof(self.data) \
+            + getsizeof(self.doc_ids)
+
+
+# positions of the postings of a text posting list, by document ID, which
+# are kept as the text of the postings and only parsed when they are read
+class PostingPositionStrings:
+    __slots__ = ('positions_strs',)
+    positions_strs: Dict[int, str]
+
+    def __init__(self, positions_strs: Dict[int, str]) -> None:
+        self.positions_strs = positions_strs
+
+    def __getitem__(self, doc_id: int) -> List[int]:
+        return list(map(int, self.positions_strs[doc_id].split(',')))
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + getsizeof(self.positions_strs) \
+            + sum(getsizeof(positions_str)
+                  for positions_str in self.positions_strs.values())
+
+
+# decoded postings of a positional posting list for the searcher: a
+# dictionary with the fields of each posting besides its positions by
+# document ID, and the positions of the postings, which are only decoded
+# for the documents whose positions are read
+class PositionalPostings(dict):
+    positions: Union[PostingPositions, PostingPositionStrings]
+
+    def __init__(self, postings: Dict[int, tuple],
+                 positions: Union[PostingPositions,
+                                  PostingPositionStrings]) -> None:
+        super().__init__(postings)
+        self.positions = positions
@@ -0,0 +1,107 @@
+from collections import defaultdict
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# the proximity of the query terms on a document is scored from the positions
+# of the query terms on the document, as (position, term) pairs sorted by
+# position, in a single pass over them. The score is multiplied by the
+# maximum boost of the index type to get the positional boost
+Positions = Sequence[Tuple[int, str]]
+
+# strategy used when none is selected, which gives nearly the same scores as
+# the gestalt pattern matching the positional boost was first defined with
+DEFAULT_PROXIMITY_STRATEGY = 'spans'
+
+
+# number of terms of the longest common subsequence of the query terms and
+# the terms of a span, keeping a single row of the dynamic programming table,
+# so the time is linear on the number of terms for a given query
+def longest_common_subsequence(query_terms: Sequence[str],
+                               terms: Sequence[str]) -> int:
+    lengths = [0] * (len(query_terms) + 1)
+    for term in terms:
+        previous_length = 0
+        for term_nr, query_term in enumerate(query_terms, 1):
+            length = lengths[term_nr]
+            if term == query_term:
+                lengths[term_nr] = previous_length + 1
+            elif lengths[term_nr - 1] > length:
+                lengths[term_nr] = lengths[term_nr - 1]
+            previous_length = length
+    return lengths[-1]
+
+
+# the positions are split into spans: each span has the terms within
+# span_size of its first term, and then the terms within span_size of the
+# last of those. Each span with more than one position adds its number of
+# terms per position it covers, times the similarity of its terms to the
+# query, which is the ratio of the terms of both on their longest common
+# subsequence, in place of the matching blocks of gestalt pattern matching
+def span_proximity(query_terms: Sequence[str], positions: Positions,
+                   span_size: int) -> float:
+    score = 0.0
+    nr_positions = len(positions)
+    start = 0
+    while start + 1 < nr_positions:
+        first_position = positions[start][0]
+        end = start + 1
+        while end < nr_positions \
+                and positions[end][0] - first_position <= span_size:
+            end += 1
+        last_position = positions[end - 1][0]
+        while end < nr_positions \
+                and positions[end][0] - last_position <= span_size:
+            end += 1
+
+        span = positions[end - 1][0] - first_position
+        if span > 0:
+            nr_terms = end - start
+            nr_common_terms = longest_common_subsequence(
+                query_terms, [term for _, term in positions[start:end]])
+            similarity = 2 * nr_common_terms / (len(query_terms) + nr_terms)
+            score += nr_terms / span * similarity
+        start = end
+
+    return score
+
+
+# the shortest window that contains every distinct query term found on the
+# document is found with a sliding window over the positions. Its score is
+# the fraction of the query terms it covers times its density, the number of
+# gaps between its terms per position it spans, and it's 0 when the window
+# is wider than span_size per gap, or the document has a single query term
+def window_proximity(query_terms: Sequence[str], positions: Positions,
+                     span_size: int) -> float:
+    nr_terms = len({term for _, term in positions})
+    if nr_terms < 2:
+        return 0.0
+
+    term_counts = defaultdict(int)
+    nr_covered_terms = 0
+    start = 0
+    min_width = None
+    for position, term in positions:
+        term_counts[term] += 1
+        if term_counts[term] == 1:
+            nr_covered_terms += 1
+        while nr_covered_terms == nr_terms:
+            width = position - positions[start][0]
+            if min_width is None or width < min_width:
+                min_width = width
+            first_term = positions[start][1]
+            term_counts[first_term] -= 1
+            if term_counts[first_term] == 0:
+                nr_covered_terms -= 1
+            start += 1
+
+    if min_width <= 0 or min_width > span_size * (nr_terms - 1):
+        return 0.0
+    return nr_terms / len(set(query_terms)) * (nr_terms - 1) / min_width
+
+
+# proximity scorers by the name of their strategy
+PROXIMITY_SCORERS: Dict[str, Callable[[Sequence[str], Positions, int],
+                                      float]] = {
+    'spans': span_proximity,
+    'window': window_proximity
+}
+PROXIMITY_STRATEGIES: List[str] = list(PROXIMITY_SCORERS)
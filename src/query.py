@@ -1,38 +1,152 @@
 import csv
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Sequence
 from math import log2, log10, sqrt
+from mmap import ACCESS_READ, mmap
 from os import path
 from statistics import mean, median
 from time import perf_counter
-from typing import DefaultDict, Dict, List, Tuple
-from difflib import SequenceMatcher
-
-from postings import PostingWeighted, PostingWeightedPositional
+from typing import (Any, DefaultDict, Dict, Iterator, List, Optional, Tuple,
+                    Union)
+from heapq import heappush, heapreplace, nlargest
+from itertools import accumulate, repeat
+
+from doc_keys import DOC_KEYS_DATA_FILE_NAME, DocKeyStore
+from index_blocks import BLOCK_FILE_EXTENSIONS, iterate_binary_records
+from lexicon import LEXICON_FILE_NAME, Lexicon
+from postings import (END_OF_POSTINGS, DecodedPostingCursor,
+                      PositionalPostings, PostingCursor, PostingPositions,
+                      PostingPositionStrings, PostingWeighted,
+                      PostingWeightedPositional)
+from posting_cache import POSTING_CACHE_MEMORY, PostingListCache
+from proximity import DEFAULT_PROXIMITY_STRATEGY, PROXIMITY_SCORERS
+from query_operators import constraint_terms, match_proximity, parse_query
+from result_cache import RESULT_CACHE_SIZE, ResultCache
+from segments import read_segments
 from tokenizer import Tokenizer
 
+# relative margin of the upper bounds of the scores of the documents, as they
+# are added in a different order than the scores themselves, so that rounding
+# errors never skip a document that could be on the top results
+PRUNING_TOLERANCE = 1e-9
+
+# number of queries of a batch whose posting lists are read together
+QUERY_BATCH_SIZE = 1000
+
+# default number of the best documents of a query, by the scores of the
+# weights of their postings, whose positions are read for the positional
+# boost
+RERANK_DEPTH = 1000
+
+
+# the natural keys and titles of the ranked documents, which are only read
+# from the document keys when they are accessed, as usually only the first
+# results are shown
+class RankedDocuments(Sequence):
+    doc_ids: List[int]
+    doc_keys: Union[Dict[int, List[str]], DocKeyStore]
+
+    def __init__(self, doc_ids: List[int],
+                 doc_keys: Union[Dict[int, List[str]], DocKeyStore]) -> None:
+        self.doc_ids = doc_ids
+        self.doc_keys = doc_keys
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.doc_key(doc_id) for doc_id in self.doc_ids[index]]
+        return self.doc_key(self.doc_ids[index])
+
+    def doc_key(self, doc_id: int) -> Tuple[str, str]:
+        doc_keys_row = self.doc_keys[doc_id]
+        return doc_keys_row[0], doc_keys_row[1]
+
 
 class Query:
     doc_keys = {}
     doc_keys_folder_path: str
     master_index_folder_path: str
-    doc_keys: Dict[int, List[str]]
-    master_index: Dict[str, List[float]]
+    doc_keys: Union[Dict[int, List[str]], DocKeyStore]
+    master_index: Union[Dict[str, List[float]], Lexicon]
     tokenizer: Tokenizer
     logarithm: Dict[int, float]
-    files_to_open: DefaultDict[int, DefaultDict[str, int]]
+    files_to_open: DefaultDict[Tuple[str, int], DefaultDict[str, int]]
     post_data: Dict[str, Dict[int, float]]
+    block_maps: Dict[str, mmap]
+    has_term_offsets: bool
+
+    # folders with final index blocks, which are the segments of incremental
+    # indexes, and the master index of each one
+    segment_folders: List[str]
+    segment_master_indexes: Dict[str, Union[Dict[str, List[float]], Lexicon]]
+    generation: int
     positional_boost_enabled: bool
     span_size: int
 
+    # name of the strategy that scores the proximity of the query terms for
+    # the positional boost
+    proximity_strategy: str
+
+    # number of the best documents of each query that get the positional
+    # boost, all of them if it's None
+    rerank_depth: Optional[int]
+
+    # number of results returned by each query, all of them if it's None
+    top_k: Optional[int]
+
+    # whether the top results are found with dynamic pruning, and the number
+    # of postings of the last query whose scores were calculated or skipped
+    dynamic_pruning: bool
+    nr_scored_postings: int
+    nr_skipped_postings: int
+
+    # results of the last queries and decoded posting lists of the last
+    # query terms, which are cleared when the generation of an incremental
+    # index changes
+    result_cache: ResultCache
+    posting_cache: PostingListCache
+
+    # posting lists of the terms of the current batch of queries, by final
+    # index block file and term, and the bytes read from the final index
+    # blocks by all queries
+    batch_postings: Dict[Tuple[str, str], Dict[int, tuple]]
+    nr_bytes_read: int
+
+    # number of processes that run the queries of the file and evaluation
+    # searches, each one with its own searcher of the index
+    workers: int
+
     def __init__(self, data_path, stopwords_path='', stemmer_enabled=True,
                  size_filter=0, use_positions=False, dump_results_file=True,
-                 cmd_results=True, positional_boost_enabled=True, span_size=4):
+                 cmd_results=True, positional_boost_enabled=True, span_size=4,
+                 top_k=None, dynamic_pruning=True,
+                 result_cache_size=RESULT_CACHE_SIZE,
+                 posting_cache_memory=POSTING_CACHE_MEMORY, workers=1,
+                 proximity_strategy=DEFAULT_PROXIMITY_STRATEGY,
+                 rerank_depth=RERANK_DEPTH):
         self.logarithm = {}
         self.search_text = ''
         self.dump_results_file = dump_results_file
         self.cmd_results = cmd_results
         self.positional_boost_enabled = positional_boost_enabled
         self.span_size = span_size
+        if proximity_strategy not in PROXIMITY_SCORERS:
+            raise ValueError('Unknown proximity strategy: {}'.format(
+                proximity_strategy))
+        self.proximity_strategy = proximity_strategy
+        self.rerank_depth = rerank_depth
+        self.top_k = top_k
+        self.dynamic_pruning = dynamic_pruning
+        self.nr_scored_postings = 0
+        self.nr_skipped_postings = 0
+        self.result_cache = ResultCache(result_cache_size)
+        self.posting_cache = PostingListCache(posting_cache_memory)
+        self.batch_postings = {}
+        self.nr_bytes_read = 0
+        self.workers = workers
 
         # data
         self.data_path = data_path
@@ -40,7 +154,6 @@ class Query:
         # files
         self.doc_keys_folder_path = path.join(data_path, 'DocKeys.tsv')
         self.master_index_folder_path = path.join(data_path, 'MasterIndex.tsv')
-        self.posting_index_block_file = path.join(data_path, 'PostingIndexBlock{}.tsv')
         self.configurations_folder_path = path.join(data_path, 'conf.ini')
         self.query_result_file = path.join(data_path, 'query_result.txt')
         self.evaluation_result_file = path.join(data_path, 'evaluation_query_result.txt')
@@ -49,6 +162,11 @@ class Query:
         self.doc_keys = {}
         self.master_index = {}
         self.post_data = {}
+        self.block_maps = {}
+        self.has_term_offsets = False
+        self.segment_folders = [data_path]
+        self.segment_master_indexes = {}
+        self.generation = 0
 
         # configurations
         self.index_type = 'raw'
@@ -56,6 +174,11 @@ class Query:
         self.stemmer_enabled = True
         self.stopwords_path = ''
         self.use_positions = False
+        self.index_format = 'tsv'
+        self.incremental = False
+        self.k = 1.2
+        self.b = 0.75
+        self.avdl = 0
 
         # positional boosting tuning parameters
         self.max_boost_lncltc = 0.02
@@ -63,6 +186,11 @@ class Query:
 
         # update configurations
         self.read_configurations()
+        self.posting_index_block_file = 'PostingIndexBlock{}' \
+            + BLOCK_FILE_EXTENSIONS[self.index_format]
+
+        if self.incremental:
+            self.read_segments()
 
         # initialize tokenizer
         self.tokenizer = Tokenizer(stopwords_path=self.stopwords_path,
@@ -80,32 +208,256 @@ class Query:
         if self.dump_results_file:
             self.clean_query_results_file()
 
-    def process_query(self, search_text) -> Tuple[List[str], float]:
+    # the results are paginated by skipping the first offset results, and
+    # returning the next top_k results, or the query's top_k if it's None
+    def process_query(self, search_text, top_k=None, offset=0,
+                      use_cache=True) -> Tuple[List[str], float]:
+        terms, constraints = parse_query(search_text, self.tokenizer)
+        return self.process_query_terms(search_text, terms, top_k, offset,
+                                        constraints, use_cache)
+
+    # the queries of each batch are tokenized first, and the final index
+    # blocks with their terms are read once for the whole batch, before the
+    # queries are processed one after the other with the same results as
+    # separately. Yields the result and time of each query
+    def process_queries(self, search_texts, top_k=None, offset=0
+                        ) -> Iterator[Tuple[List[str], float]]:
+        if self.workers > 1:
+            yield from self.process_queries_parallel(search_texts, top_k,
+                                                     offset)
+            return
+
+        for start in range(0, len(search_texts), QUERY_BATCH_SIZE):
+            batch = [(search_text,
+                      *parse_query(search_text, self.tokenizer))
+                     for search_text in search_texts[start:start
+                                                     + QUERY_BATCH_SIZE]]
+            self.read_batch_posting_lists(
+                [terms for search_text, terms, constraints in batch],
+                self.top_k if top_k is None else top_k)
+            for search_text, terms, constraints in batch:
+                yield self.process_query_terms(search_text, terms, top_k,
+                                               offset, constraints)
+        self.batch_postings.clear()
+
+    # the queries are split into chunks, which are processed in batches by
+    # the worker processes. The results are returned in the order of the
+    # queries, with the time of each query measured by its worker, and are
+    # written to the results file by this process
+    def process_queries_parallel(self, search_texts, top_k=None, offset=0
+                                 ) -> Iterator[Tuple[List[str], float]]:
+        chunks = self.split_queries(search_texts)
+        with self.create_worker_pool() as executor:
+            for chunk, chunk_results in zip(chunks, executor.map(
+                    process_worker_queries, chunks, repeat(top_k),
+                    repeat(offset))):
+                for search_text, (doc_ids, total_time, nr_scored_postings,
+                                  nr_skipped_postings) in zip(chunk,
+                                                              chunk_results):
+                    self.search_text = search_text
+                    self.nr_scored_postings = nr_scored_postings
+                    self.nr_skipped_postings = nr_skipped_postings
+                    result = {}
+                    if doc_ids is not None:
+                        result = RankedDocuments(doc_ids, self.doc_keys)
+                        if self.dump_results_file:
+                            self.dump_query_result(result)
+                    yield result, total_time
+
+    # chunks of consecutive queries, several for each worker so that the
+    # workers that get the faster queries aren't left idle
+    def split_queries(self, queries):
+        chunk_size = min(QUERY_BATCH_SIZE,
+                         max(1, -(-len(queries) // (4 * self.workers))))
+        return [queries[start:start + chunk_size]
+                for start in range(0, len(queries), chunk_size)]
+
+    def create_worker_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=initialize_query_worker,
+                                   initargs=(self.get_worker_arguments(),))
+
+    # the arguments of the searchers of the worker processes, which don't
+    # write any files
+    def get_worker_arguments(self) -> Dict[str, Any]:
+        return {
+            'data_path': self.data_path,
+            'dump_results_file': False,
+            'cmd_results': False,
+            'positional_boost_enabled': self.positional_boost_enabled,
+            'span_size': self.span_size,
+            'proximity_strategy': self.proximity_strategy,
+            'rerank_depth': self.rerank_depth,
+            'top_k': self.top_k,
+            'dynamic_pruning': self.dynamic_pruning,
+            'result_cache_size': self.result_cache.max_entries,
+            'posting_cache_memory': self.posting_cache.max_memory
+        }
+
+    # the phrases and proximity operators of the query are only applied on
+    # positional indexes, and otherwise their words are searched like the
+    # other words of the query. Without use_cache the results are searched
+    # even if they are on the result cache, and aren't added to it
+    def process_query_terms(self, search_text, terms, top_k=None, offset=0,
+                            constraints=(),
+                            use_cache=True) -> Tuple[List[str], float]:
         self.search_text = search_text
-        terms = self.tokenizer.tokenize_positional(search_text)
+        if top_k is None:
+            top_k = self.top_k
+        if not self.use_positions:
+            constraints = ()
+        self.nr_scored_postings = 0
+        self.nr_skipped_postings = 0
         start_time = perf_counter()
         result = {}
-        
-        if self.index_type == 'lnc.ltc':
-            result = self.lncltc_search(terms)
+
+        if self.incremental:
+            self.check_generation()
+        cache_key = self.result_cache_key(terms, top_k, offset, constraints)
+        cached_doc_ids = self.result_cache.get(cache_key) if use_cache \
+            else None
+        if cached_doc_ids is not None:
+            result = RankedDocuments(cached_doc_ids, self.doc_keys)
+            if self.dump_results_file:
+                self.dump_query_result(result)
+        elif self.index_type == 'lnc.ltc':
+            result = self.lncltc_search(terms, top_k, offset, constraints)
         elif self.index_type == 'bm25':
-            result = self.bm25_search(terms)
+            result = self.bm25_search(terms, top_k, offset, constraints)
+        if use_cache and cached_doc_ids is None \
+                and isinstance(result, RankedDocuments):
+            self.result_cache.put(cache_key, result.doc_ids)
 
         total_time = perf_counter() - start_time
         return result, total_time
 
+    # queries with the same terms, each one repeated the same number of
+    # times, have the same results. The positional boost also depends on the
+    # order of the terms, so they are only sorted when it isn't applied
+    def result_cache_key(self, terms, top_k, offset, constraints=()):
+        term_counts = tuple((term, len(terms[term])) for term in terms)
+        if not (self.use_positions and self.positional_boost_enabled):
+            term_counts = tuple(sorted(term_counts))
+        return (term_counts, self.positional_boost_enabled, self.span_size,
+                self.proximity_strategy, self.rerank_depth, constraints, top_k,
+                offset)
+
+    # an incremental index that was appended to or merged since it was read
+    # is read again, and the cached results are cleared
+    def check_generation(self):
+        generation, _ = read_segments(self.data_path)
+        if generation == self.generation:
+            return
+        self.result_cache.clear()
+        self.posting_cache.clear()
+        self.batch_postings.clear()
+        self.block_maps.clear()
+        self.doc_keys = {}
+        self.segment_master_indexes = {}
+        self.read_segments()
+        self.read_doc_keys()
+        self.read_master_index()
+
+    def get_statistics(self):
+        statistics = self.result_cache.get_statistics()
+        statistics.update(self.posting_cache.get_statistics())
+        statistics['Bytes read from the final index blocks'] = \
+            self.nr_bytes_read
+        return statistics
+
+    # the posting lists of the terms of a batch of queries are grouped by
+    # final index block, and each block is read once. The binary posting
+    # lists that the queries read through cursors aren't decoded
+    def read_batch_posting_lists(self, batch_terms, top_k):
+        if self.incremental:
+            self.check_generation()
+        self.batch_postings.clear()
+        self.files_to_open.clear()
+        self.store_files_to_open({term: [] for terms in batch_terms
+                                  for term in terms})
+        use_cursors = self.is_dynamic_pruning_enabled(top_k)
+
+        for segment_folder, file_number in self.files_to_open:
+            master_index = self.segment_master_indexes[segment_folder]
+            file_name = path.join(
+                segment_folder,
+                self.posting_index_block_file.format(file_number))
+            terms_to_analyse = [
+                term for term in self.files_to_open[segment_folder,
+                                                    file_number]
+                if not (use_cursors
+                        and self.has_posting_cursor(master_index, term))]
+            if len(terms_to_analyse) > 0:
+                self.read_posting_index_block(file_name, terms_to_analyse,
+                                              master_index)
+                for term in self.post_data:
+                    self.batch_postings[file_name, term] = \
+                        self.post_data[term]
+        self.files_to_open.clear()
+
+    # the document keys of incremental BM25 indexes also have the length of
+    # each document. The document keys of binary indexes are memory mapped
+    # instead of read into memory
     def read_doc_keys(self):
+        if self.index_format == 'binary' and path.exists(
+                path.join(self.data_path, DOC_KEYS_DATA_FILE_NAME)):
+            self.doc_keys = DocKeyStore(self.data_path)
+            return
+
         with open(self.doc_keys_folder_path, 'r') as file:
             filecontent = csv.reader(file, delimiter='\t')
             for row in filecontent:
-                self.doc_keys[int(row[0])] = row[1:3]
-
+                self.doc_keys[int(row[0])] = row[1:4]
+
+    # the statistics of the whole collection of an incremental index are
+    # the sums of the ones of its segments
+    def read_segments(self):
+        self.generation, segments = read_segments(self.data_path)
+        self.segment_folders = [path.join(self.data_path, segment.name)
+                                for segment in segments]
+        nr_docs = sum(segment.nr_docs for segment in segments)
+        if nr_docs > 0:
+            self.avdl = sum(segment.total_doc_length
+                            for segment in segments) / nr_docs
+
+    # the master index of an incremental index has the IDF and document
+    # frequency of each term, and the master index of each segment has the
+    # document frequency, block number and offsets of the postings
     def read_master_index(self):
-        with open(self.master_index_folder_path, 'r') as file:
+        self.master_index = self.read_master_index_file(
+            self.master_index_folder_path)
+        if self.incremental:
+            for segment_folder in self.segment_folders:
+                self.segment_master_indexes[segment_folder] = \
+                    self.read_master_index_file(
+                        path.join(segment_folder, 'MasterIndex.tsv'))
+        else:
+            self.segment_master_indexes[self.data_path] = self.master_index
+
+    # indexes created before the byte offsets of the postings were stored on
+    # the master index only have the IDF and the block number. The lexicon of
+    # binary indexes is memory mapped instead of read into memory
+    def read_master_index_file(self, file_path):
+        lexicon_path = path.join(path.dirname(file_path), LEXICON_FILE_NAME)
+        if self.index_format == 'binary' and path.exists(lexicon_path):
+            lexicon = Lexicon(lexicon_path)
+            if lexicon.nr_values > 2:
+                self.has_term_offsets = True
+            return lexicon
+
+        master_index = {}
+        with open(file_path, 'r') as file:
             filecontent = csv.reader(file, delimiter='\t')
             for row in filecontent:
-                self.master_index[row[0]] = [float(value)
-                                             for value in row[1:3]]
+                if len(row) > 3:
+                    self.has_term_offsets = True
+                    master_index[row[0]] = [float(row[1]), float(row[2]),
+                                            int(row[3]), int(row[4])] \
+                        + [float(value) for value in row[5:6]]
+                else:
+                    master_index[row[0]] = [float(value)
+                                            for value in row[1:3]]
+        return master_index
 
     def read_configurations(self):
         with open(self.configurations_folder_path, 'r') as file:
@@ -127,8 +479,16 @@ class Query:
                         self.use_positions = True
                     else:
                         self.use_positions = False
-
-    def bm25_search(self, terms):
+                elif row[0] == 'index_format':
+                    self.index_format = row[1]
+                elif row[0] == 'incremental':
+                    self.incremental = row[1] == 'True'
+                elif row[0] == 'k':
+                    self.k = float(row[1])
+                elif row[0] == 'b':
+                    self.b = float(row[1])
+
+    def bm25_search(self, terms, top_k=None, offset=0, constraints=()):
         bm25_ranking = defaultdict(float)
         self.files_to_open.clear()
 
@@ -136,43 +496,48 @@ class Query:
         # the PostingIndexBlock file
         self.store_files_to_open(terms)
 
-        posts = {}
-        for file_number in self.files_to_open:
-            file_name = self.posting_index_block_file.format(int(file_number))
-            posts.update(self.post_data)
-
-            self.read_posting_index_block(file_name, self.files_to_open[file_number])
-
-            for term in self.files_to_open[file_number]:
-                counter = self.files_to_open[file_number][term]
+        if len(constraints) > 0:
+            return self.operator_search(
+                {term: (len(terms[term]), 1) for term in terms}, terms,
+                constraints, top_k, offset)
+
+        if self.is_dynamic_pruning_enabled(top_k):
+            return self.max_score_search(
+                {term: (len(terms[term]), 1) for term in terms},
+                top_k, offset)
+
+        positional_postings = []
+        for segment_folder, file_number in self.files_to_open:
+            file_name = path.join(
+                segment_folder,
+                self.posting_index_block_file.format(file_number))
+            terms_to_analyse = self.files_to_open[segment_folder, file_number]
+            self.read_posting_index_block(
+                file_name, terms_to_analyse,
+                self.segment_master_indexes[segment_folder])
+            if self.use_positions:
+                positional_postings.extend(
+                    (term, self.post_data[term]) for term in terms_to_analyse)
+
+            for term in terms_to_analyse:
+                counter = terms_to_analyse[term]
+                self.nr_scored_postings += len(self.post_data[term])
                 for doc_id in self.post_data[term]:
                     bm25_ranking[doc_id] += self.post_data[term][doc_id][0] * counter
 
         # apply positional boost
         if self.use_positions and self.positional_boost_enabled:
-            positions_index = defaultdict(list)
-            query_term_list = []
-            for term in terms:
-                for term_position in terms[term]:
-                    query_term_list.append(term)
-            for term in posts:
-                for doc_id in posts[term]:
-                    for term_position in posts[term][doc_id][1]:
-                        positions_index[doc_id].append((term_position, term))
-            for doc_id in positions_index:
-                positions_index[doc_id].sort(key=lambda x: x[0])
-                bm25_ranking[doc_id] += self.calculate_positional_boost(query_term_list, positions_index[doc_id])
-
-        results = []
-        for score, doc_id in sorted(((value, key) for (key,value) in bm25_ranking.items()), reverse=True):
-            results.append((self.doc_keys[doc_id][0], self.doc_keys[doc_id][1]))
+            self.apply_positional_boost(bm25_ranking, terms,
+                                        positional_postings)
+
+        results = self.rank_documents(bm25_ranking, top_k, offset)
 
         if self.dump_results_file:
             self.dump_query_result(results)
 
         return results
 
-    def lncltc_search(self, terms):
+    def lncltc_search(self, terms, top_k=None, offset=0, constraints=()):
         lnc_ltc_ranking = defaultdict(float)
         self.files_to_open.clear()
 
@@ -189,112 +554,488 @@ class Query:
             Wtqs[term] = Wtq
         Wtq_norm = sqrt(Wtq_norm)
 
-        posts = {}
-        for file_number in self.files_to_open:
-            file_name = self.posting_index_block_file.format(file_number)
-            posts.update(self.post_data)
-
-            self.read_posting_index_block(file_name, self.files_to_open[file_number])
-
-            for term in self.files_to_open[file_number]:
+        if len(constraints) > 0:
+            return self.operator_search(
+                {term: (Wtqs[term], Wtq_norm) for term in common_terms},
+                terms, constraints, top_k, offset)
+
+        if self.is_dynamic_pruning_enabled(top_k):
+            return self.max_score_search(
+                {term: (Wtqs[term], Wtq_norm) for term in common_terms},
+                top_k, offset)
+
+        positional_postings = []
+        for segment_folder, file_number in self.files_to_open:
+            file_name = path.join(
+                segment_folder,
+                self.posting_index_block_file.format(file_number))
+            terms_to_analyse = self.files_to_open[segment_folder, file_number]
+            self.read_posting_index_block(
+                file_name, terms_to_analyse,
+                self.segment_master_indexes[segment_folder])
+            if self.use_positions:
+                positional_postings.extend(
+                    (term, self.post_data[term]) for term in terms_to_analyse)
+
+            for term in terms_to_analyse:
+                self.nr_scored_postings += len(self.post_data[term])
                 for doc_id in self.post_data[term]:
                     Wtd = self.post_data[term][doc_id][0]
                     lnc_ltc_ranking[doc_id] += Wtd * Wtqs[term] / Wtq_norm
 
         # apply positional boost
         if self.use_positions and self.positional_boost_enabled:
-            positions_index = defaultdict(list)
-            query_term_list = []
-            for term in terms:
-                for term_position in terms[term]:
-                    query_term_list.append(term)
-            for term in posts:
-                for doc_id in posts[term]:
-                    for term_position in posts[term][doc_id][1]:
-                        positions_index[doc_id].append((term_position, term))
-            for doc_id in positions_index:
-                positions_index[doc_id].sort(key=lambda x: x[0])
-                lnc_ltc_ranking[doc_id] += self.calculate_positional_boost(query_term_list, positions_index[doc_id])
-
-        results = []
-        for score, doc_id in sorted(((value, key) for (key,value) in lnc_ltc_ranking.items()), reverse=True):
-            results.append((self.doc_keys[doc_id][0], self.doc_keys[doc_id][1]))
+            self.apply_positional_boost(lnc_ltc_ranking, terms,
+                                        positional_postings)
+
+        results = self.rank_documents(lnc_ltc_ranking, top_k, offset)
+
+        if self.dump_results_file:
+            self.dump_query_result(results)
+
+        return results
+
+    # the ranking is made with the weights of the postings first, and then
+    # the positions of the query terms are only decoded for the best
+    # documents, up to the rerank depth, which get the positional boost. The
+    # boost is never negative, so the other documents stay below them
+    def apply_positional_boost(self, ranking, terms, positional_postings):
+        query_term_list = []
+        for term in terms:
+            for term_position in terms[term]:
+                query_term_list.append(term)
+
+        if self.rerank_depth is None:
+            candidates = list(ranking)
+        else:
+            candidates = [doc_id for score, doc_id in nlargest(
+                self.rerank_depth,
+                ((score, doc_id) for doc_id, score in ranking.items()))]
+
+        for doc_id in candidates:
+            positions_list = []
+            for term, postings in positional_postings:
+                if doc_id in postings:
+                    for term_position in postings.positions[doc_id]:
+                        positions_list.append((term_position, term))
+            positions_list.sort(key=lambda x: x[0])
+            ranking[doc_id] += self.calculate_positional_boost(query_term_list, positions_list)
+
+    # the documents are ordered by descending score, and by descending
+    # document ID when their scores are the same. Only the documents up to
+    # the end of the requested page are selected from the ranking, without
+    # sorting the whole ranking
+    def rank_documents(self, ranking, top_k=None, offset=0):
+        scored_docs = ((score, doc_id) for doc_id, score in ranking.items())
+        if top_k is None:
+            ranked_docs = sorted(scored_docs, reverse=True)[offset:]
+        else:
+            ranked_docs = nlargest(offset + top_k, scored_docs)[offset:]
+        return RankedDocuments([doc_id for score, doc_id in ranked_docs],
+                               self.doc_keys)
+
+    # the positional boost doesn't have an upper bound, so the documents are
+    # only pruned when it isn't applied
+    def is_dynamic_pruning_enabled(self, top_k):
+        return self.dynamic_pruning and top_k is not None \
+            and not (self.use_positions and self.positional_boost_enabled)
+
+    # document-at-a-time search of the best offset + top_k documents with
+    # MaxScore dynamic pruning. The score that each term adds to a document
+    # is the weight of its posting multiplied by the first query weight of
+    # the term and divided by the second one, as in the exhaustive search.
+    # The segments of incremental indexes have different documents, so they
+    # are searched one after the other while keeping the same top documents
+    def max_score_search(self, query_weights, top_k, offset):
+        top_docs = []
+        for segment_folder in self.segment_folders:
+            segment_cursors = self.read_segment_cursors(segment_folder)
+            if len(segment_cursors) > 0:
+                self.max_score_segment_search(
+                    segment_folder, segment_cursors, query_weights,
+                    top_docs, offset + top_k)
+
+        results = RankedDocuments(
+            [doc_id for score, doc_id in sorted(top_docs, reverse=True)]
+            [offset:], self.doc_keys)
+        if self.dump_results_file:
+            self.dump_query_result(results)
+
+        return results
 
+    # cursors over the postings of the query terms on a segment, in the order
+    # in which the exhaustive search adds their scores. The binary posting
+    # lists of terms with their max impact on the master index are only
+    # decoded as the cursors get to their postings, while the others are
+    # decoded when they are read
+    def read_segment_cursors(self, segment_folder):
+        segment_cursors = {}
+        master_index = self.segment_master_indexes[segment_folder]
+        for block_folder, file_number in self.files_to_open:
+            if block_folder != segment_folder:
+                continue
+            terms_to_analyse = self.files_to_open[segment_folder, file_number]
+            file_name = path.join(
+                segment_folder,
+                self.posting_index_block_file.format(file_number))
+            decoded_terms = [term for term in terms_to_analyse
+                             if not self.has_posting_cursor(master_index,
+                                                            term)]
+            self.post_data.clear()
+            if len(decoded_terms) > 0:
+                self.read_posting_index_block(file_name, decoded_terms,
+                                              master_index)
+            for term in terms_to_analyse:
+                if term in self.post_data:
+                    postings = self.post_data[term]
+                    segment_cursors[term] = DecodedPostingCursor(
+                        list(postings), list(postings.values()),
+                        getattr(postings, 'positions', None))
+                else:
+                    segment_cursors[term] = self.posting_cursor(
+                        file_name, master_index, term)
+        return segment_cursors
+
+    # document-at-a-time search of the documents that match the phrases and
+    # proximity operators of the query, with the same scores as the
+    # exhaustive search. The cursors of the terms of the operators are
+    # intersected first, starting from the shortest posting list, and the
+    # positions of the terms are only read for the documents that have all
+    # of them. The cursors of the other query terms are then advanced to the
+    # documents that match, which get the positional boost
+    def operator_search(self, query_weights, terms, constraints, top_k,
+                        offset):
+        ranking = {}
+        operator_terms = constraint_terms(constraints)
+        query_term_list = []
+        for term in terms:
+            for term_position in terms[term]:
+                query_term_list.append(term)
+
+        for segment_folder in self.segment_folders:
+            master_index = self.segment_master_indexes[segment_folder]
+            if any(term not in master_index for term in operator_terms):
+                continue
+            segment_cursors = self.read_segment_cursors(segment_folder)
+            cursors = sorted((segment_cursors[term]
+                              for term in operator_terms), key=len)
+            scoring_cursors = [(term, segment_cursors[term])
+                               + query_weights[term]
+                               for term in segment_cursors]
+
+            nr_scored_postings = 0
+            doc_id = cursors[0].next()
+            while doc_id != END_OF_POSTINGS:
+                next_doc_id = doc_id
+                for cursor in cursors[1:]:
+                    next_doc_id = cursor.advance(doc_id)
+                    if next_doc_id != doc_id:
+                        break
+                if next_doc_id != doc_id:
+                    doc_id = cursors[0].advance(next_doc_id)
+                    continue
+
+                term_positions = {term: segment_cursors[term].positions()
+                                  for term in operator_terms}
+                if all(match_proximity(constraint, term_positions)
+                       for constraint in constraints):
+                    score = 0.0
+                    positions_list = []
+                    for term, cursor, multiplier, divisor in scoring_cursors:
+                        if cursor.advance(doc_id) == doc_id:
+                            score += cursor.fields()[0] * multiplier / divisor
+                            nr_scored_postings += 1
+                            if self.positional_boost_enabled:
+                                for term_position in cursor.positions():
+                                    positions_list.append(
+                                        (term_position, term))
+                    if self.positional_boost_enabled:
+                        positions_list.sort(key=lambda x: x[0])
+                        score += self.calculate_positional_boost(
+                            query_term_list, positions_list)
+                    ranking[doc_id] = score
+                doc_id = cursors[0].next()
+
+            self.nr_scored_postings += nr_scored_postings
+            self.nr_skipped_postings += sum(
+                len(cursor) for _, cursor, _, _ in scoring_cursors) \
+                - nr_scored_postings
+
+        results = self.rank_documents(ranking, top_k, offset)
         if self.dump_results_file:
             self.dump_query_result(results)
 
         return results
 
+    def has_posting_cursor(self, master_index, term):
+        return self.has_term_offsets and self.index_format == 'binary' \
+            and len(master_index[term]) > 4
+
+    def posting_cursor(self, file_to_analyse, master_index, term):
+        block_map = self.map_block_file(file_to_analyse)
+        offset, length = master_index[term][2:4]
+        self.nr_bytes_read += length
+        posting_class = PostingWeightedPositional if self.use_positions \
+            else PostingWeighted
+        return PostingCursor(posting_class,
+                             memoryview(block_map)[offset:offset + length])
+
+    # the greatest weight of the postings of a term is on the master index
+    # of weighted indexes, except on the segments of incremental indexes
+    def max_impact(self, segment_folder, term, cursor):
+        master_index_row = self.segment_master_indexes[segment_folder][term]
+        if len(master_index_row) > 4:
+            return master_index_row[4]
+        return max(fields[0] for fields in cursor.fields_list)
+
+    # the terms are ordered by the upper bound of the score they can add to
+    # a document. Once the sum of the upper bounds of the first terms is
+    # below the score of the last of the top documents, those terms are no
+    # longer essential: only the documents of the other terms are visited,
+    # and the cursors of the first terms are only advanced to them, from the
+    # greatest upper bound down, while the document can still reach the top
+    # documents. The scores of the documents that can are added in the same
+    # order as in the exhaustive search, so they are the same
+    def max_score_segment_search(self, segment_folder, segment_cursors,
+                                 query_weights, top_docs, nr_results):
+        upper_bounds = {}
+        for term in segment_cursors:
+            multiplier, divisor = query_weights[term]
+            upper_bounds[term] = self.max_impact(
+                segment_folder, term, segment_cursors[term]) \
+                * multiplier / divisor
+        bound_terms = sorted(segment_cursors, key=upper_bounds.get)
+        bound_sums = list(accumulate(upper_bounds[term]
+                                     for term in bound_terms))
+        term_upper_bounds = [upper_bounds[term] for term in bound_terms]
+        term_factors = [query_weights[term][0] / query_weights[term][1]
+                        for term in bound_terms]
+        cursors = [segment_cursors[term] for term in bound_terms]
+        scoring_cursors = [(segment_cursors[term],) + query_weights[term]
+                           for term in segment_cursors]
+        nr_terms = len(bound_terms)
+        first_essential = 0
+        threshold = None
+        for cursor in cursors:
+            cursor.next()
+
+        nr_scored_postings = 0
+        while True:
+            if len(top_docs) >= nr_results:
+                threshold = top_docs[0][0] / (1 + PRUNING_TOLERANCE)
+                while first_essential < nr_terms \
+                        and bound_sums[first_essential] < threshold:
+                    first_essential += 1
+            essential_cursors = cursors[first_essential:]
+
+            # the next document of the essential terms
+            doc_id = END_OF_POSTINGS
+            for cursor in essential_cursors:
+                if cursor.doc_id < doc_id:
+                    doc_id = cursor.doc_id
+            if doc_id == END_OF_POSTINGS:
+                break
+
+            upper_bound = bound_sums[first_essential - 1] \
+                if first_essential > 0 else 0.0
+            nr_doc_postings = 0
+            for term_nr in range(first_essential, nr_terms):
+                cursor = cursors[term_nr]
+                if cursor.doc_id == doc_id:
+                    upper_bound += cursor.fields()[0] * term_factors[term_nr]
+                    nr_doc_postings += 1
+
+            if threshold is not None:
+                term_nr = first_essential - 1
+                while term_nr >= 0 and upper_bound >= threshold:
+                    upper_bound -= term_upper_bounds[term_nr]
+                    cursor = cursors[term_nr]
+                    if cursor.advance(doc_id) == doc_id:
+                        upper_bound += cursor.fields()[0] \
+                            * term_factors[term_nr]
+                        nr_doc_postings += 1
+                    term_nr -= 1
+
+            if threshold is None or upper_bound >= threshold:
+                nr_doc_postings = 0
+                score = 0.0
+                for cursor, multiplier, divisor in scoring_cursors:
+                    if cursor.advance(doc_id) == doc_id:
+                        score += cursor.fields()[0] * multiplier / divisor
+                        nr_doc_postings += 1
+
+                if len(top_docs) < nr_results:
+                    heappush(top_docs, (score, doc_id))
+                elif (score, doc_id) > top_docs[0]:
+                    heapreplace(top_docs, (score, doc_id))
+            nr_scored_postings += nr_doc_postings
+
+            for cursor in essential_cursors:
+                if cursor.doc_id == doc_id:
+                    cursor.next()
+
+        self.nr_scored_postings += nr_scored_postings
+        self.nr_skipped_postings += sum(len(cursor) for cursor in cursors) \
+            - nr_scored_postings
+
+    # the proximity of the query terms on a document, as scored by the
+    # selected strategy, up to the maximum boost of the index type
     def calculate_positional_boost(self, query_term_list: List[str], positions_list: List[Tuple[int, str]]) -> float:
         if self.index_type == 'lnc.ltc':
             max_boost = self.max_boost_lncltc
         elif self.index_type == 'bm25':
             max_boost = self.max_boost_bm25
 
-        total_boost = 0
-        i = 0
-        while i + 1 < len(positions_list):
-            contained_terms = []
-            contained_terms.append(positions_list[i])
-
-            # consider all terms after the current one that are within the span
-            start_position = positions_list[i][0]
-            i += 1
-            while i < len(positions_list) and positions_list[i][0] - start_position <= self.span_size:
-                contained_terms.append(positions_list[i])
-                i += 1
-
-            # consider all terms after the last one within the span that fall within the span centered on that last one
-            start_position = positions_list[i - 1][0]
-            
-            while i < len(positions_list) and positions_list[i][0] - start_position <= self.span_size:
-                contained_terms.append(positions_list[i])
-                i += 1
-
-            span = contained_terms[-1][0] - contained_terms[0][0]
-            if len(contained_terms) > 0 and span > 0:
-                query_similarity = SequenceMatcher(None, query_term_list, [term[1] for term in contained_terms]).ratio()
-                total_boost += len(contained_terms) / span * query_similarity * max_boost
-
-        return total_boost
+        proximity_scorer = PROXIMITY_SCORERS[self.proximity_strategy]
+        return proximity_scorer(query_term_list, positions_list,
+                                self.span_size) * max_boost
 
     def dump_query_result(self, results):
         with open(self.query_result_file, mode='a', encoding='utf8',
                   newline='') as f:
             f.write('Q: {} \n'.format(self.search_text))
-            i = 0
-            for result in results:
-                if i < 100:
-                    f.writelines(result[0])
-                    f.write('\n')
-                i += 1
+            for result in results[:100]:
+                f.writelines(result[0])
+                f.write('\n')
 
+    # the postings of a term are on one final index block of each segment
+    # that contains it
     def store_files_to_open(self, terms):
 
         for term in terms:
-            if term in self.master_index:
-                doc = int(self.master_index[term][1])
-                self.files_to_open[doc][term] = len(terms[term])
-
-    def read_posting_index_block(self, file_to_analyse, terms_to_analyse):
+            for segment_folder in self.segment_folders:
+                segment_master_index = \
+                    self.segment_master_indexes[segment_folder]
+                if term in segment_master_index:
+                    doc = int(segment_master_index[term][1])
+                    self.files_to_open[segment_folder, doc][term] = \
+                        len(terms[term])
+
+    # the posting lists of the terms of the current batch of queries, and of
+    # the terms that were decoded by the last queries, which are on the
+    # posting cache, aren't read again
+    def read_posting_index_block(self, file_to_analyse, terms_to_analyse,
+                                 master_index):
         self.post_data.clear()
-        with open(file_to_analyse, 'r') as file:
-            filecontent = csv.reader(file, delimiter='\t')
-            for content in filecontent:
-                term = content[0]
-
-                if term in terms_to_analyse:
-
-                    post = {}
-                    for n in range(1, len(content)):
-                        if self.use_positions:
-                            posting = PostingWeightedPositional.from_string(
-                                content[n])
-                            post[posting.doc_id] = (posting.weight, posting.positions)
-                        else:
-                            posting = PostingWeighted.from_string(content[n])
-                            post[posting.doc_id] = (posting.weight,)
-                    self.post_data[term] = post
+        terms_to_read = []
+        for term in terms_to_analyse:
+            postings = self.batch_postings.get((file_to_analyse, term))
+            if postings is None:
+                postings = self.posting_cache.get((file_to_analyse, term))
+            if postings is None:
+                terms_to_read.append(term)
+            else:
+                self.post_data[term] = postings
+        if len(terms_to_read) == 0:
+            return
+
+        if self.has_term_offsets:
+            self.read_term_posting_lists(file_to_analyse, terms_to_read,
+                                         master_index)
+        elif self.index_format == 'binary':
+            self.read_binary_posting_index_block(file_to_analyse,
+                                                 terms_to_read)
+        else:
+            self.nr_bytes_read += path.getsize(file_to_analyse)
+            with open(file_to_analyse, 'r') as file:
+                filecontent = csv.reader(file, delimiter='\t')
+                for content in filecontent:
+                    term = content[0]
+
+                    if term in terms_to_read:
+                        self.post_data[term] = self.postings_from_row(content)
+
+        for term in terms_to_read:
+            if term in self.post_data:
+                self.posting_cache.put((file_to_analyse, term),
+                                       self.post_data[term])
+
+    # the block file is memory mapped and only the bytes of the posting lists
+    # of the terms are read, using their offsets on the master index
+    def read_term_posting_lists(self, file_to_analyse, terms_to_analyse,
+                                master_index):
+        block_map = self.map_block_file(file_to_analyse)
+
+        for term in terms_to_analyse:
+            offset, length = master_index[term][2:4]
+            data = block_map[offset:offset + length]
+            self.nr_bytes_read += length
+            if self.index_format == 'binary':
+                self.post_data[term] = self.postings_from_bytes(data)
+            else:
+                row = next(csv.reader([data.decode('utf8')], delimiter='\t'))
+                self.post_data[term] = self.postings_from_row(row)
+
+            if self.incremental and self.index_type == 'bm25':
+                self.calculate_bm25_weights(term, self.post_data[term])
+
+    def map_block_file(self, file_to_analyse):
+        if file_to_analyse not in self.block_maps:
+            with open(file_to_analyse, 'rb') as file:
+                self.block_maps[file_to_analyse] = mmap(file.fileno(), 0,
+                                                        access=ACCESS_READ)
+        return self.block_maps[file_to_analyse]
+
+    # the segments of incremental BM25 indexes have the term frequencies as
+    # weights, which are weighted with the IDF and average document length
+    # of the whole index when they are read
+    def calculate_bm25_weights(self, term, postings):
+        idf = self.master_index[term][0]
+        for doc_id in postings:
+            tf = postings[doc_id][0]
+            dl = int(self.doc_keys[doc_id][2])
+            dividend = (self.k + 1) * tf
+            B = (1 - self.b) + self.b * (dl / self.avdl)
+            divider = (self.k * B) + tf
+            weight = dividend / divider
+            postings[doc_id] = (weight * idf,) + postings[doc_id][1:]
+
+    # the posting lists of the other terms are skipped without being decoded
+    def read_binary_posting_index_block(self, file_to_analyse,
+                                        terms_to_analyse):
+        with open(file_to_analyse, 'rb') as file:
+            data = file.read()
+        self.nr_bytes_read += len(data)
+
+        for term, start, end in iterate_binary_records(data):
+            if term in terms_to_analyse:
+                self.post_data[term] = self.postings_from_bytes(
+                    data[start:end])
+
+    # the positions of the postings of positional indexes are left as text,
+    # and only parsed for the documents that get the positional boost
+    def postings_from_row(self, row):
+        post = {}
+        if self.use_positions:
+            positions_strs = {}
+            for n in range(1, len(row)):
+                doc_id_str, weight_str, positions_str = row[n].split(':')
+                doc_id = int(doc_id_str)
+                post[doc_id] = (float(weight_str),)
+                positions_strs[doc_id] = positions_str
+            return PositionalPostings(post,
+                                      PostingPositionStrings(positions_strs))
+        for n in range(1, len(row)):
+            posting = PostingWeighted.from_string(row[n])
+            post[posting.doc_id] = (posting.weight,)
+        return post
+
+    # the positions of binary posting lists are stored after the other
+    # fields, and are only decoded for the documents that get the positional
+    # boost
+    def postings_from_bytes(self, data):
+        if self.use_positions:
+            columns, positions_offset = \
+                PostingWeightedPositional.columns_from_bytes(
+                    data, positions=False)
+            doc_ids, weights = columns
+            return PositionalPostings(
+                dict(zip(doc_ids, zip(weights))),
+                PostingPositions(data, positions_offset, doc_ids))
+        else:
+            columns, _ = PostingWeighted.columns_from_bytes(data)
+            doc_ids, weights = columns
+            return dict(zip(doc_ids, zip(weights)))
 
     def clean_query_results_file(self):
         if path.exists(self.query_result_file):
@@ -328,10 +1069,12 @@ class Query:
         """
         evaluates the results for a single query.
         """
-        # repeat the query 10 times to stabilize time metrics
+        # repeat the query 10 times to stabilize time metrics, without the
+        # result cache, so that every run searches the index
         query_times = []
         for i in range(10):
-            query_ranking, query_time = self.process_query(query_str)
+            query_ranking, query_time = self.process_query(query_str,
+                                                           use_cache=False)
             query_times.append(query_time)
         mean_query_time = mean(query_times)
 
@@ -415,12 +1158,35 @@ class Query:
         """
         standard_results = self.read_silver_standard_file(file_path)
 
-        query_statistics = []   # a list with the statistics for each query
-        for query in standard_results:
-            query_statistics.append(self.evaluate_query_results(query, standard_results[query]))
+        # the queries are evaluated by the worker processes in chunks, and
+        # their statistics are kept in the order of the queries
+        if self.workers > 1:
+            query_statistics = []
+            chunks = [{query: standard_results[query] for query in chunk}
+                      for chunk in self.split_queries(list(standard_results))]
+            with self.create_worker_pool() as executor:
+                for chunk_statistics in executor.map(evaluate_worker_queries,
+                                                     chunks):
+                    query_statistics.extend(chunk_statistics)
+        else:
+            query_statistics = self.evaluate_queries(standard_results)
 
         return self.evaluate_mean_statistics(query_statistics)
 
+    # the posting lists of each batch of queries are read together
+    def evaluate_queries(self, standard_results: Dict[str, List[Tuple[str, int]]]) -> List[Dict[int, Dict[str, float]]]:
+        query_statistics = []   # a list with the statistics for each query
+        queries = list(standard_results)
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            batch = queries[start:start + QUERY_BATCH_SIZE]
+            self.read_batch_posting_lists(
+                [parse_query(query, self.tokenizer)[0] for query in batch],
+                self.top_k)
+            for query in batch:
+                query_statistics.append(self.evaluate_query_results(query, standard_results[query]))
+        self.batch_postings.clear()
+        return query_statistics
+
     def show_evaluation_results(self, result):
         for rank in result.keys():
             print("\nTOP {}".format(rank))
@@ -434,4 +1200,38 @@ class Query:
                 f.writelines("TOP {} \n".format(rank))
                 for stat in result[rank].keys():
                     f.writelines("{}: {:.2f}\n".format(stat, result[rank][stat]))
-                f.write('\n')
\ No newline at end of file
+                f.write('\n')
+
+
+# searcher of each worker process of a parallel search
+worker_query: Query
+
+
+def initialize_query_worker(query_arguments: Dict[str, Any]) -> None:
+    global worker_query
+    worker_query = Query(**query_arguments)
+
+
+# the document IDs of the results of each query, or None if the index type
+# has no ranking, the time of the query and its numbers of postings scored
+# and skipped
+def process_worker_queries(search_texts: List[str], top_k: Optional[int],
+                           offset: int) -> List[Tuple[Optional[List[int]],
+                                                      float, int, int]]:
+    query_results = []
+    for result, total_time in worker_query.process_queries(search_texts,
+                                                           top_k, offset):
+        doc_ids = list(result.doc_ids) \
+            if isinstance(result, RankedDocuments) else None
+        query_results.append((doc_ids, total_time,
+                              worker_query.nr_scored_postings,
+                              worker_query.nr_skipped_postings))
+    return query_results
+
+
+def evaluate_worker_queries(standard_results: Dict[str, List[Tuple[str, int]]]
+                            ) -> List[Dict[int, Dict[str, float]]]:
+    return [{rank_nr: dict(statistics)
+             for rank_nr, statistics in query_statistics.items()}
+            for query_statistics in worker_query.evaluate_queries(
+                standard_results)]
@@ -37,3 +37,26 @@ from query import Query
 # new_file = dataset_name + 'query_result.txt'
 # reference_file = dataset_name + 'query_result_reference.txt'
 # # assert cmp(new_file, reference_file, shallow=False)
+
+# # proximity scorers unit test
+# from proximity import span_proximity, window_proximity
+# positions = [(1, 'steam'), (2, 'key'), (9, 'steam')]
+# assert span_proximity(['steam', 'key'], positions, 4) == 2.0
+# assert window_proximity(['steam', 'key'], positions, 4) == 1.0
+# assert window_proximity(['steam', 'key'], positions[:1], 4) == 0.0
+
+# # phrase and proximity operators unit test
+# from query_operators import match_proximity, parse_query
+# from tokenizer import Tokenizer
+# tokenizer = Tokenizer(stopwords_path='content/stopwords.txt')
+# terms, constraints = parse_query('"love of music" NEAR/3 album great',
+#                                  tokenizer)
+# assert list(terms) == ['love', 'music', 'album', 'great']
+# phrase = constraints[0].operands[0]
+# assert phrase.terms == (('love', 0), ('music', 2))
+# assert match_proximity(constraints[0], {'love': [4], 'music': [6],
+#                                         'album': [9]})
+# assert not match_proximity(constraints[0], {'love': [4], 'music': [7],
+#                                             'album': [9]})
+# assert not match_proximity(constraints[0], {'love': [4], 'music': [6],
+#                                             'album': [10]})
@@ -0,0 +1,152 @@
+import re
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from tokenizer import Tokenizer
+
+# queries may have phrases, which are quoted, and proximity operators between
+# words or phrases: "steam key" matches the documents with the words one
+# after the other, and steam NEAR/3 key the documents with the words at most
+# 3 positions apart, in any order. Operators can be chained, as in
+# "gift card" NEAR/5 steam NEAR/2 code, where each operand must be near the
+# previous one. The words of the operators are also searched like the other
+# words of the query, which rank the documents that match the operators
+QUERY_TOKEN_PATTERN = re.compile(r'"([^"]*)"|NEAR/(\d+)(?!\S)|(\S+)')
+
+
+# the terms of a phrase, with the offset of each one from the position of the
+# first one. Stopwords and words removed by the size filter keep their
+# positions, so they are gaps between the terms
+class Phrase(NamedTuple):
+    terms: Tuple[Tuple[str, int], ...]
+
+    # offset of the last term
+    @property
+    def length(self) -> int:
+        return self.terms[-1][1]
+
+
+# operands that must be found on a document, each one at most the distance
+# before it away from the previous one, or a single phrase
+class Proximity(NamedTuple):
+    operands: Tuple[Phrase, ...]
+    distances: Tuple[int, ...]
+
+
+# returns the terms of the query, with their positions on the query as given
+# by tokenize_positional, and the proximity operators and phrases of the
+# query. Operators with an operand without any term, such as a stopword, are
+# left out, and their words are searched like the other words
+def parse_query(search_text: str, tokenizer: Tokenizer
+                ) -> Tuple[Dict[str, List[int]], Tuple[Proximity, ...]]:
+    if '"' not in search_text and 'NEAR/' not in search_text:
+        return tokenizer.tokenize_positional(search_text), ()
+
+    operand_texts = []
+    groups = []
+    group = None
+    distance = None
+    for match in QUERY_TOKEN_PATTERN.finditer(search_text):
+        phrase_text, distance_text, word = match.groups()
+        if distance_text is not None:
+            if group is not None:
+                distance = int(distance_text)
+            continue
+
+        operand_text = word if phrase_text is None else phrase_text
+        operand_texts.append(operand_text)
+        operand = parse_phrase(operand_text, tokenizer)
+        if distance is not None:
+            group.append((distance, operand))
+        else:
+            group = [(None, operand)]
+            groups.append(group)
+        distance = None
+
+    constraints = []
+    for group in groups:
+        operands = tuple(operand for _, operand in group)
+        if any(operand is None for operand in operands):
+            continue
+        if len(operands) > 1 or operands[0].length > 0:
+            constraints.append(Proximity(
+                operands, tuple(distance for distance, _ in group[1:])))
+
+    return tokenizer.tokenize_positional(' '.join(operand_texts)), \
+        tuple(constraints)
+
+
+def parse_phrase(phrase_text: str, tokenizer: Tokenizer) -> Optional[Phrase]:
+    tokens = tokenizer.tokenize_positional(phrase_text)
+    positions = sorted((position, term) for term in tokens
+                       for position in tokens[term])
+    if len(positions) == 0:
+        return None
+    first_position = positions[0][0]
+    return Phrase(tuple((term, position - first_position)
+                        for position, term in positions))
+
+
+# the terms of the operators of the query
+def constraint_terms(constraints: Sequence[Proximity]) -> List[str]:
+    terms = []
+    for constraint in constraints:
+        for operand in constraint.operands:
+            for term, _ in operand.terms:
+                if term not in terms:
+                    terms.append(term)
+    return terms
+
+
+# the positions where the phrase starts on a document, given the sorted
+# positions of each of its terms on the document. The positions of each term
+# are shifted back by its offset and merged with the starts found so far
+def match_phrase(phrase: Phrase,
+                 term_positions: Dict[str, Sequence[int]]) -> List[int]:
+    starts = list(term_positions[phrase.terms[0][0]])
+    for term, offset in phrase.terms[1:]:
+        positions = term_positions[term]
+        matched_starts = []
+        start_nr = 0
+        position_nr = 0
+        while start_nr < len(starts) and position_nr < len(positions):
+            start = positions[position_nr] - offset
+            if starts[start_nr] < start:
+                start_nr += 1
+            elif starts[start_nr] > start:
+                position_nr += 1
+            else:
+                matched_starts.append(start)
+                start_nr += 1
+                position_nr += 1
+        starts = matched_starts
+    return starts
+
+
+# whether the operands are found on a document, each one near a match of
+# the previous one. The matches of an operand are spans from the position of
+# its first term to the position of its last term, and two spans are near
+# when they don't overlap and there are at most the distance positions from
+# the end of the first one to the start of the other
+def match_proximity(proximity: Proximity,
+                    term_positions: Dict[str, Sequence[int]]) -> bool:
+    operand = proximity.operands[0]
+    starts = match_phrase(operand, term_positions)
+    length = operand.length
+    for operand, distance in zip(proximity.operands[1:],
+                                 proximity.distances):
+        if len(starts) == 0:
+            return False
+        ends = [start + length for start in starts]
+        near_starts = []
+        for start in match_phrase(operand, term_positions):
+            end = start + operand.length
+            end_nr = bisect_left(ends, start - distance)
+            start_nr = bisect_left(starts, end + 1)
+            if (end_nr < len(ends) and ends[end_nr] < start) \
+                    or (start_nr < len(starts)
+                        and starts[start_nr] <= end + distance):
+                near_starts.append(start)
+        starts = near_starts
+        length = operand.length
+    return len(starts) > 0
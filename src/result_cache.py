@@ -0,0 +1,34 @@
+from array import array
+from sys import getsizeof
+from typing import Hashable, Sequence
+
+from lru_cache import LRUCache
+
+# default number of queries whose results are kept by the searcher, and the
+# default memory budget of the cached results in bytes
+RESULT_CACHE_SIZE = 1000
+RESULT_CACHE_MEMORY = 64 * 1024 * 1024
+
+
+# estimated bytes of memory used by a cache key, which is a tuple of
+# strings, numbers and tuples of them
+def estimate_key_size(key: Hashable) -> int:
+    size = getsizeof(key)
+    if isinstance(key, tuple):
+        size += sum(estimate_key_size(element) for element in key)
+    return size
+
+
+# least recently used cache of the ranked document IDs of queries, bounded
+# by the number of queries and by the memory of their results. The document
+# IDs are kept in a typed array, so each result takes 4 bytes
+class ResultCache(LRUCache):
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE,
+                 max_memory: int = RESULT_CACHE_MEMORY) -> None:
+        super().__init__('Result cache', max_memory, max_entries)
+
+    def put(self, key: Hashable, doc_ids: Sequence[int]) -> None:
+        doc_ids = array('I', doc_ids)
+        super().put(key, doc_ids,
+                    estimate_key_size(key) + getsizeof(doc_ids))
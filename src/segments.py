@@ -0,0 +1,101 @@
+from csv import reader, writer
+from os import path, replace
+from typing import List, NamedTuple, Optional, Tuple
+
+# an incremental index is made of segments, each one a subfolder of the index
+# folder with its own final index blocks and master index. The segments file
+# lists the segments of the index in document order, and its generation is
+# incremented whenever they change, so that searchers can tell that the index
+# was updated
+SEGMENTS_FILE_NAME = 'Segments.tsv'
+
+# segments replaced by a merge are listed on the obsolete segments file with
+# the generation that left them out, and their folders are only removed once
+# a later generation is published, as a searcher may still be reading them
+# with the previous segments file
+OBSOLETE_SEGMENTS_FILE_NAME = 'ObsoleteSegments.tsv'
+
+# number of adjacent segments of the same size tier that are merged together
+MERGE_FACTOR = 4
+
+
+class Segment(NamedTuple):
+    name: str
+    nr_docs: int
+    nr_postings: int
+    # sum of the lengths of the documents, only used by BM25 indexes
+    total_doc_length: int
+
+
+def read_segments(index_folder_path: str) -> Tuple[int, List[Segment]]:
+    file_path = path.join(index_folder_path, SEGMENTS_FILE_NAME)
+    if not path.exists(file_path):
+        return 0, []
+
+    with open(file_path, mode='rt', encoding='utf8',
+              newline='') as segments_file:
+        file_reader = reader(segments_file, delimiter='\t')
+        generation = int(next(file_reader)[1])
+        segments = [Segment(row[0], int(row[1]), int(row[2]), int(row[3]))
+                    for row in file_reader]
+
+    return generation, segments
+
+
+# the segments file is written to a temporary file first and then replaces
+# the previous one, so that a searcher never reads a partial list
+def write_segments(index_folder_path: str, generation: int,
+                   segments: List[Segment]) -> None:
+    file_path = path.join(index_folder_path, SEGMENTS_FILE_NAME)
+    with open(file_path + '.tmp', mode='wt', encoding='utf8',
+              newline='') as segments_file:
+        file_writer = writer(segments_file, delimiter='\t')
+        file_writer.writerow(['generation', generation])
+        for segment in segments:
+            file_writer.writerow(segment)
+    replace(file_path + '.tmp', file_path)
+
+
+def read_obsolete_segments(index_folder_path: str) -> List[Tuple[str, int]]:
+    file_path = path.join(index_folder_path, OBSOLETE_SEGMENTS_FILE_NAME)
+    if not path.exists(file_path):
+        return []
+
+    with open(file_path, mode='rt', encoding='utf8',
+              newline='') as segments_file:
+        return [(row[0], int(row[1]))
+                for row in reader(segments_file, delimiter='\t')]
+
+
+def write_obsolete_segments(index_folder_path: str,
+                            obsolete_segments: List[Tuple[str, int]]) -> None:
+    file_path = path.join(index_folder_path, OBSOLETE_SEGMENTS_FILE_NAME)
+    with open(file_path + '.tmp', mode='wt', encoding='utf8',
+              newline='') as segments_file:
+        writer(segments_file, delimiter='\t').writerows(obsolete_segments)
+    replace(file_path + '.tmp', file_path)
+
+
+# segments are in the same tier when their number of postings has the same
+# order of magnitude in base MERGE_FACTOR
+def get_size_tier(segment: Segment, merge_factor: int = MERGE_FACTOR) -> int:
+    tier = 0
+    nr_postings = segment.nr_postings
+    while nr_postings >= merge_factor:
+        nr_postings //= merge_factor
+        tier += 1
+    return tier
+
+
+# size-tiered merge policy: returns the start and end of the first run of
+# adjacent segments of the same tier long enough to be merged, if there is
+# one. Only adjacent segments are merged, so that the document IDs of the
+# merged segment remain ordered
+def select_segments_to_merge(segments: List[Segment],
+                             merge_factor: int = MERGE_FACTOR
+                             ) -> Optional[Tuple[int, int]]:
+    tiers = [get_size_tier(segment, merge_factor) for segment in segments]
+    for start in range(len(segments) - merge_factor + 1):
+        if len(set(tiers[start:start + merge_factor])) == 1:
+            return start, start + merge_factor
+    return None
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import signal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from statistics import mean, median
+from time import perf_counter
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple, Union
+
+from query import Query
+
+# address where the search server listens by default
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+
+# number of requests waiting to be searched, and of requests of a connection
+# waiting for their responses, before the server stops reading new ones
+MAX_PENDING_REQUESTS = 1024
+MAX_CONNECTION_REQUESTS = 64
+
+# greatest number of requests searched together as a batch
+MAX_BATCH_SIZE = 256
+
+# number of the last requests whose latency is kept for the statistics
+LATENCY_WINDOW = 1000
+
+# the search server answers requests over a TCP socket with a line protocol:
+# each request is a line with a JSON object, and the server writes a line
+# with a JSON object for each request, in the order of the requests of each
+# connection. A search request has the query and optionally top_k and offset:
+#   {"query": "greatest rock album", "top_k": 10, "offset": 0}
+# and its response has the results, as pairs of review ID and title, and the
+# time of the search in seconds, or an error:
+#   {"results": [["R1727O064AACPA", "Five Stars"], ...], "time": 0.012}
+# The statistics request {"command": "stats"} returns the status of the
+# server, the numbers of requests in flight, answered and failed, their
+# latency in milliseconds and the statistics of the searcher
+Request = Dict[str, Any]
+Response = Dict[str, Any]
+
+
+# server around a single searcher of the index, which is loaded once. The
+# searcher isn't thread safe, so the searches run on a single thread of a
+# thread pool, which keeps the event loop free while the posting lists are
+# read. The requests that arrive while a batch is searched are searched
+# together as the next batch, so that the blocks of their terms are read once
+class SearchServer:
+    query: Query
+    host: str
+    port: int
+    executor: ThreadPoolExecutor
+    pending_requests: 'asyncio.Queue[Tuple[Request, asyncio.Future]]'
+    stop_event: asyncio.Event
+    connections: Set[asyncio.StreamWriter]
+    connection_tasks: Set['asyncio.Task[None]']
+    nr_in_flight: int
+    nr_requests: int
+    nr_errors: int
+    latencies: Deque[float]
+    shutting_down: bool
+
+    def __init__(self, query: Query, host: str = SERVER_HOST,
+                 port: int = SERVER_PORT) -> None:
+        self.query = query
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.connections = set()
+        self.connection_tasks = set()
+        self.nr_in_flight = 0
+        self.nr_requests = 0
+        self.nr_errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.shutting_down = False
+
+    # serves until the process gets an interrupt or termination signal, or
+    # shutdown is called, and then stops accepting connections and answers
+    # the requests already received before closing the connections, and
+    # waits for their tasks to finish
+    async def serve(self, ready: Optional[asyncio.Event] = None) -> None:
+        loop = asyncio.get_running_loop()
+        self.pending_requests = asyncio.Queue(MAX_PENDING_REQUESTS)
+        self.stop_event = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self.shutdown)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # signals are only handled on the main thread of Unix
+                pass
+
+        server = await asyncio.start_server(self.handle_connection,
+                                            self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        search_task = loop.create_task(self.search_requests())
+        if ready is not None:
+            ready.set()
+
+        await self.stop_event.wait()
+        server.close()
+        await self.pending_requests.join()
+        search_task.cancel()
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connection_tasks, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+
+    def shutdown(self) -> None:
+        self.shutting_down = True
+        self.stop_event.set()
+
+    # the requests of a connection are read while the previous ones are
+    # searched, and answered in order by a separate task
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        connection_task = asyncio.current_task()
+        self.connection_tasks.add(connection_task)
+        self.connections.add(writer)
+        responses = asyncio.Queue(MAX_CONNECTION_REQUESTS)
+        writer_task = asyncio.get_running_loop().create_task(
+            self.write_responses(responses, writer))
+        try:
+            while not self.shutting_down:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    await responses.put(await self.receive_request(line))
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            await responses.put(None)
+            await writer_task
+            self.connections.discard(writer)
+            self.connection_tasks.discard(connection_task)
+            writer.close()
+
+    async def write_responses(self, responses: asyncio.Queue,
+                              writer: asyncio.StreamWriter) -> None:
+        while True:
+            response = await responses.get()
+            if response is None:
+                return
+            response = await response
+            try:
+                writer.write(json.dumps(response).encode('utf8') + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    # returns a future with the response, as searches wait for their turn
+    # on the queue of pending requests, which blocks reading when it's full
+    async def receive_request(self, line: bytes) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        start_time = perf_counter()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('The request must be a JSON object.')
+            if request.get('command') == 'stats':
+                future.set_result(self.get_statistics())
+                return future
+            if request.get('command') is not None:
+                raise ValueError('Unknown command.')
+            if self.shutting_down:
+                raise ValueError('The server is shutting down.')
+            request = self.parse_search_request(request)
+        except ValueError as error:
+            self.nr_errors += 1
+            future.set_result({'error': str(error)})
+            return future
+
+        self.nr_in_flight += 1
+        await self.pending_requests.put((request, future))
+        future.add_done_callback(
+            lambda _: self.finish_request(perf_counter() - start_time))
+        return future
+
+    def parse_search_request(self, request: Request) -> Request:
+        if not isinstance(request.get('query'), str):
+            raise ValueError('The request must have a query string.')
+        top_k = request.get('top_k', self.query.top_k)
+        offset = request.get('offset', 0)
+        # JSON booleans are ints in Python, so they are rejected explicitly
+        if top_k is not None and (isinstance(top_k, bool)
+                                  or not isinstance(top_k, int)
+                                  or top_k <= 0):
+            raise ValueError('top_k must be a positive number.')
+        if isinstance(offset, bool) or not isinstance(offset, int) \
+                or offset < 0:
+            raise ValueError('offset must not be negative.')
+        return {'query': request['query'], 'top_k': top_k, 'offset': offset}
+
+    def finish_request(self, latency: float) -> None:
+        self.nr_in_flight -= 1
+        self.nr_requests += 1
+        self.latencies.append(latency)
+
+    # the requests waiting on the queue are taken together as a batch, which
+    # is searched on the thread pool
+    async def search_requests(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.pending_requests.get()]
+            while len(batch) < MAX_BATCH_SIZE \
+                    and not self.pending_requests.empty():
+                batch.append(self.pending_requests.get_nowait())
+
+            try:
+                responses = await loop.run_in_executor(
+                    self.executor, self.search_batch,
+                    [request for request, future in batch])
+            except Exception as error:
+                responses = [{'error': str(error)}] * len(batch)
+            self.nr_errors += sum('error' in response
+                                  for response in responses)
+            for (request, future), response in zip(batch, responses):
+                future.set_result(response)
+                self.pending_requests.task_done()
+
+    # the requests with the same top_k and offset are searched together,
+    # and the responses are returned in the order of the requests. When the
+    # search of a group fails, its requests are searched one at a time, so
+    # that only the ones that fail get an error
+    def search_batch(self, requests: List[Request]) -> List[Response]:
+        responses = [None] * len(requests)
+        request_numbers = sorted(
+            range(len(requests)),
+            key=lambda request_nr: self.pagination_order(requests[request_nr]))
+        for (top_k, offset), group in groupby(
+                request_numbers,
+                key=lambda request_nr: (requests[request_nr]['top_k'],
+                                        requests[request_nr]['offset'])):
+            group = list(group)
+            search_texts = [requests[request_nr]['query']
+                            for request_nr in group]
+            try:
+                group_results = list(self.query.process_queries(
+                    search_texts, top_k, offset))
+            except Exception:
+                group_results = [self.search_request(search_text, top_k,
+                                                     offset)
+                                 for search_text in search_texts]
+            for request_nr, group_result in zip(group, group_results):
+                responses[request_nr] = self.search_response(group_result)
+        return responses
+
+    # returns the error of a request that fails in place of its results
+    def search_request(self, search_text: str, top_k: Optional[int],
+                       offset: int) -> Union[Tuple[Any, float], Exception]:
+        try:
+            return self.query.process_query(search_text, top_k, offset)
+        except Exception as error:
+            return error
+
+    @staticmethod
+    def search_response(
+            search_result: Union[Tuple[Any, float], Exception]) -> Response:
+        if isinstance(search_result, Exception):
+            return {'error': str(search_result)}
+        result, total_time = search_result
+        return {
+            'results': [list(doc_key) for doc_key in result[:]]
+            if result else [],
+            'time': total_time
+        }
+
+    # requests without top_k are sorted after the ones that have it
+    @staticmethod
+    def pagination_order(request: Request) -> Tuple[bool, int, int]:
+        return (request['top_k'] is None, request['top_k'] or 0,
+                request['offset'])
+
+    def get_statistics(self) -> Dict[str, Any]:
+        latencies = [latency * 1000 for latency in self.latencies]
+        statistics = {
+            'status': 'shutting down' if self.shutting_down else 'ok',
+            'requests in flight': self.nr_in_flight,
+            'requests queued': self.pending_requests.qsize(),
+            'requests answered': self.nr_requests,
+            'requests failed': self.nr_errors,
+            'mean latency (ms)': mean(latencies) if latencies else 0,
+            'median latency (ms)': median(latencies) if latencies else 0,
+            '95th percentile latency (ms)': sorted(latencies)[
+                int(0.95 * (len(latencies) - 1))] if latencies else 0,
+            'max latency (ms)': max(latencies, default=0)
+        }
+        statistics.update(self.query.get_statistics())
+        return statistics
+
+
+def run_server(query: Query, host: str = SERVER_HOST,
+               port: int = SERVER_PORT) -> None:
+    asyncio.run(SearchServer(query, host, port).serve())
@@ -1,9 +1,28 @@
 from collections import defaultdict
-from re import sub
+from re import compile
 from typing import Dict, List, Set
 
 from Stemmer import Stemmer
 
+# patterns of the regex engine, which replaces HTML line breaks and symbols by
+# spaces and then removes words that start or end with numbers
+SEPARATORS_PATTERN = compile('<br />|[^0-9a-zA-Z]+')
+MIXED_WORDS_PATTERN = compile('[^a-zA-Z ]+[a-zA-Z]+|[a-zA-Z]+[^a-zA-Z ]+')
+DIGITS_PATTERN = compile('[0-9]')
+LINE_BREAK = '<br />'
+
+
+# translation table of the translate engine, which lower cases letters, keeps
+# digits and replaces any other character by a space
+class WordCharacterTable(dict):
+    def __missing__(self, key: int) -> str:
+        return ' '
+
+
+WORD_CHARACTER_TABLE = WordCharacterTable(
+    (code, chr(code).lower()) for code in range(128)
+    if chr(code).isascii() and chr(code).isalnum())
+
 
 class Tokenizer:
     stopwords_path: str
@@ -13,10 +32,27 @@ class Tokenizer:
     stemmer: Stemmer
     use_positions: bool
 
+    # stems of the words already stemmed, which is cleared when adding more
+    # words would exceed its size
+    stem_cache: Dict[str, str]
+    stem_cache_size: int
+    stem_cache_hits: int
+    stem_cache_misses: int
+    batch_stemming: bool
+    engine: str
+
     # an empty string as a stopwords_path disables stopwords.
-    # a size_filter of 0 disables size filter
+    # a size_filter of 0 disables size filter.
+    # with batch_stemming the words of each document that aren't on the stem
+    # cache are stemmed at once, before its words are filtered.
+    # the engine is either 'translate' or 'regex', and both give the same words
     def __init__(self, stopwords_path: str = 'content/stopwords.txt',
-                 stemmer_enabled: bool = True, size_filter: int = 3) -> None:
+                 stemmer_enabled: bool = True, size_filter: int = 3,
+                 stem_cache_size: int = 100000,
+                 batch_stemming: bool = False,
+                 engine: str = 'translate') -> None:
+        if engine not in ('translate', 'regex'):
+            raise ValueError('Unknown tokenizer engine: {}'.format(engine))
 
         self.stopwords_path = stopwords_path
         if stopwords_path != '':
@@ -31,21 +67,44 @@ class Tokenizer:
 
         self.size_filter = size_filter
 
+        self.stem_cache = {}
+        self.stem_cache_size = stem_cache_size
+        self.stem_cache_hits = 0
+        self.stem_cache_misses = 0
+        self.batch_stemming = batch_stemming
+        self.engine = engine
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            'Stem cache hits': self.stem_cache_hits,
+            'Stem cache misses': self.stem_cache_misses,
+        }
+
     # makes a single iteration over all words to apply the stopword filter, the
     # size filter and the stemmer, to avoid multiple passes
     def tokenize(self, input_string: str) -> Set[str]:
         word_list = self.preprocess_input(input_string)
         tokens = set()
+        if self.stemmer_enabled and self.batch_stemming:
+            self.stem_new_words(word_list)
+        stem_cache = self.stem_cache
+        stopwords = self.stopwords
+        size_filter = self.size_filter
+        stemmer_enabled = self.stemmer_enabled
+        nr_stemmed_words = 0
 
-        for i in range(0, len(word_list)):
-            if word_list[i] not in self.stopwords:
-                if len(word_list[i]) > self.size_filter:
-                    if self.stemmer_enabled:
-                        token = self.stemmer.stemWord(word_list[i])
-                    else:
-                        token = word_list[i]
-                    tokens.add(token)
+        for word in word_list:
+            if word not in stopwords and len(word) > size_filter:
+                if stemmer_enabled:
+                    nr_stemmed_words += 1
+                    token = stem_cache.get(word)
+                    if token is None:
+                        token = self.stem_new_word(word)
+                else:
+                    token = word
+                tokens.add(token)
 
+        self.stem_cache_hits += nr_stemmed_words
         return tokens
 
     # similar to the tokenize method but also returns a list of positions
@@ -53,25 +112,121 @@ class Tokenizer:
     def tokenize_positional(self, input_string: str) -> Dict[str, List[int]]:
         word_list = self.preprocess_input(input_string)
         tokens = defaultdict(lambda: [])
+        if self.stemmer_enabled and self.batch_stemming:
+            self.stem_new_words(word_list)
+        stem_cache = self.stem_cache
+        stopwords = self.stopwords
+        size_filter = self.size_filter
+        stemmer_enabled = self.stemmer_enabled
+        nr_stemmed_words = 0
 
-        for i in range(0, len(word_list)):
-            if word_list[i] not in self.stopwords:
-                if len(word_list[i]) > self.size_filter:
-                    if self.stemmer_enabled:
-                        token = self.stemmer.stemWord(word_list[i])
-                    else:
-                        token = word_list[i]
-                    tokens[token].append(i)
+        for i, word in enumerate(word_list):
+            if word not in stopwords and len(word) > size_filter:
+                if stemmer_enabled:
+                    nr_stemmed_words += 1
+                    token = stem_cache.get(word)
+                    if token is None:
+                        token = self.stem_new_word(word)
+                else:
+                    token = word
+                tokens[token].append(i)
 
+        self.stem_cache_hits += nr_stemmed_words
         return tokens
 
+    # stem a word that isn't on the stem cache and add it to the cache. The
+    # hits are counted by the callers for all the stemmed words, so each
+    # miss is taken from them
+    def stem_new_word(self, word: str) -> str:
+        self.stem_cache_misses += 1
+        self.stem_cache_hits -= 1
+        if len(self.stem_cache) >= self.stem_cache_size:
+            self.stem_cache.clear()
+        token = self.stemmer.stemWord(word)
+        self.stem_cache[word] = token
+        return token
+
+    # stem the unique words of a document that pass the filters and aren't
+    # on the stem cache with a single call to the stemmer. When the cache is
+    # full only the stems of the words of the document are kept, so that all
+    # of them are on the cache until the document is tokenized
+    def stem_new_words(self, word_list: List[str]) -> None:
+        unique_words = set(word_list)
+        new_words = [word for word in unique_words
+                     if word not in self.stem_cache
+                     and word not in self.stopwords
+                     and len(word) > self.size_filter]
+        if len(new_words) == 0:
+            return
+
+        self.stem_cache_misses += len(new_words)
+        self.stem_cache_hits -= len(new_words)
+        if len(self.stem_cache) + len(new_words) > self.stem_cache_size:
+            self.stem_cache = {word: self.stem_cache[word]
+                               for word in unique_words
+                               if word in self.stem_cache}
+        self.stem_cache.update(zip(new_words,
+                                   self.stemmer.stemWords(new_words)))
+
     # the input string has all HTML line breaks and symbols replaced by spaces,
     # and words that start or end with numbers are then removed. It is then
     # made all lower case and split into substrings using the spaces to get
-    # the words
+    # the words, and the position of each word is its index on the list
     def preprocess_input(self, input_string: str) -> List[str]:
-        word_list = sub('<br />|[^0-9a-zA-Z]+', ' ', input_string)
-        word_list = sub('[^a-zA-Z ]+[a-zA-Z]+|[a-zA-Z]+[^a-zA-Z ]+',
-                        '', word_list).lower().split(' ')
+        if self.engine == 'regex':
+            return self.preprocess_input_regex(input_string)
+
+        if LINE_BREAK not in input_string:
+            return self.split_words(input_string)
+
+        word_list = []
+        for text in self.split_line_breaks(input_string):
+            word_list += self.split_words(text)
+        return word_list
+
+    def preprocess_input_regex(self, input_string: str) -> List[str]:
+        word_list = SEPARATORS_PATTERN.sub(' ', input_string)
+        word_list = MIXED_WORDS_PATTERN.sub('', word_list).lower().split(' ')
+
+        return word_list
+
+    # the regex engine only replaces a line break by a space of its own when
+    # it follows a letter or a number, the start of the input or another such
+    # line break. Any other line break is part of a run of symbols, so it
+    # leaves the word 'br' behind. This splits the input on the line breaks
+    # of the first kind, and the words of the input are the words of the
+    # parts
+    def split_line_breaks(self, input_string: str) -> List[str]:
+        texts = []
+        text = None
+        for part in input_string.split(LINE_BREAK):
+            if text is None:
+                text = part
+            elif text == '' or (text[-1].isascii() and text[-1].isalnum()):
+                texts.append(text)
+                text = part
+            else:
+                text += LINE_BREAK + part
+        texts.append(text)
+        return texts
+
+    # the translate engine replaces every symbol by a space instead of every
+    # run of symbols, so an empty word is added where the text starts or ends
+    # with symbols, as the regex engine does, and only the words that mix
+    # letters and numbers go through the regex
+    def split_words(self, text: str) -> List[str]:
+        text = text.translate(WORD_CHARACTER_TABLE)
+        if text == '':
+            return ['']
+
+        word_list = text.split()
+        if text[0] == ' ':
+            word_list = [''] + word_list
+        if text[-1] == ' ':
+            word_list.append('')
 
+        if DIGITS_PATTERN.search(text) is not None:
+            word_list = [word if word.isalpha() or word.isdigit()
+                         else MIXED_WORDS_PATTERN.sub('', word)
+                         for word in word_list]
         return word_list
@@ -1,6 +1,50 @@
+import gzip
+from csv import QUOTE_NONE, reader
+
 from tokenizer import Tokenizer
 
 tokenizer = Tokenizer(stopwords_path='', stemmer_enabled=True, size_filter=0)
 input_str = 'Some test phrase!'
 tokens = tokenizer.tokenize(input_str)
 print(tokens)
+
+# the stem cache and batch stemming must give the same tokens as stemming
+# each word separately
+uncached_tokenizer = Tokenizer(stopwords_path='', stemmer_enabled=True,
+                               size_filter=0, stem_cache_size=0)
+batch_tokenizer = Tokenizer(stopwords_path='', stemmer_enabled=True,
+                            size_filter=0, batch_stemming=True)
+input_str = 'Played the game, the games were played and replayed'
+for test_tokenizer in [tokenizer, batch_tokenizer]:
+    assert test_tokenizer.tokenize_positional(input_str) \
+        == uncached_tokenizer.tokenize_positional(input_str)
+    assert test_tokenizer.tokenize(input_str) \
+        == uncached_tokenizer.tokenize(input_str)
+print(batch_tokenizer.get_statistics())
+
+
+# golden test: the translate engine must give the same words and positions as
+# the regex engine on every document of a data source
+def tokenizer_engine_test(test_file):
+    regex_tokenizer = Tokenizer(stopwords_path='', stemmer_enabled=False,
+                                size_filter=0, engine='regex')
+    translate_tokenizer = Tokenizer(stopwords_path='', stemmer_enabled=False,
+                                    size_filter=0, engine='translate')
+
+    with gzip.open(test_file, mode='rt', encoding='utf8',
+                   newline='') as data_file:
+        data_reader = reader(data_file, delimiter='\t', quoting=QUOTE_NONE)
+        next(data_reader)
+        for doc in data_reader:
+            doc_body = '{} {} {}'.format(doc[5], doc[12], doc[13])
+            assert translate_tokenizer.preprocess_input(doc_body) \
+                == regex_tokenizer.preprocess_input(doc_body)
+            assert list(translate_tokenizer.tokenize_positional(
+                doc_body).items()) \
+                == list(regex_tokenizer.tokenize_positional(doc_body).items())
+    print(test_file, 'OK')
+
+
+tokenizer_engine_test('content/data1.tsv.gz')
+tokenizer_engine_test(
+    'content/amazon_reviews_us_Digital_Video_Games_v1_00_sample.tsv.gz')